@@ -10,7 +10,8 @@ def generate_waypts():
     '''
     R = 0.06
     num_waypts = 100
-    center = np.array((0.19, 0, 0.025))
+    # far enough from the base that ik solutions are within joint limits
+    center = np.array((0.21, 0, 0.025))
     angles = np.linspace(0, 2*np.pi, num=num_waypts)
     waypts = np.zeros((num_waypts, 3)) + center
     waypts[:, 0] += R * np.cos(angles)
@@ -33,7 +34,10 @@ def follow_waypts_sim(waypts):
     for i in range(1, len(waypts)):
         pb.addUserDebugLine(waypts[i-1], waypts[i],
                             [0.8,0.3,0.2], 2)
-        robot.move_hand_to(waypts[i])
+
+    # the next waypt is commanded while approaching the current one, so the
+    # hand moves continuously instead of stopping at every waypt
+    robot.move_hand_through(waypts[1:])
 
     time.sleep(1)
 
@@ -43,10 +47,9 @@ def follow_waypts_real(waypts):
     With real robot, the motion is not smooth if we call
     robot.move_hand_to(...) for each waypt.  This is because
     the movement is monitored for collisions, which introduces
-    some delay.  Instead, we need to send move commands directly
-    to the controller with robot.controller.move_servos(...) with
-    more precise timing between commands.  For this reason, you
-    must be careful that the workspace is empty.
+    some delay.  Instead, we compute the joint positions in advance
+    and stream them as a timed trajectory with robot.execute_trajectory(...),
+    which checks the whole trajectory for collisions before moving.
     '''
     robot = RobotArm('real')
 
@@ -56,11 +59,11 @@ def follow_waypts_real(waypts):
         arm_jpos, _ = robot.mp.calculate_ik(waypt)
         arm_jposs.append(arm_jpos)
 
-    robot.move_arm_jpos(arm_jposs[0])
-    joint_ids = robot.controller.arm_joint_ids
-    for arm_jpos in arm_jposs:
-        robot.controller.move_servos(joint_ids, arm_jpos, duration=15)
-        time.sleep(0.015)
+    # one waypt every 15 ms
+    timestamps = 0.015 * np.arange(len(arm_jposs))
+    success, info = robot.execute_trajectory(timestamps, arm_jposs)
+    if success:
+        print(f'max lateness: {1000*np.max(info["lateness"]):.1f} ms')
 
     time.sleep(1)
 
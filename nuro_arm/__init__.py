@@ -1,4 +1,5 @@
 from nuro_arm.robot.robot_arm import RobotArm
+from nuro_arm.robot.async_robot_arm import AsyncRobotArm
 
 try:
     from nuro_arm.camera.camera import Camera
@@ -9,6 +9,7 @@ from nuro_arm.camera import camera_utils
 from nuro_arm.camera.gui import GUI
 from nuro_arm.camera.capturer import Capturer, SimCapturer
 from nuro_arm import constants
+from nuro_arm.world_version import bump_world_version
 
 class Camera:
     def __init__(self,
@@ -210,6 +211,7 @@ class Camera:
                                                 physicsClientId=self._pb_client)
         self.rod_collision_obj = pb.loadURDF(rod_urdf_path, rod_pos, rod_quat,
                                              physicsClientId=self._pb_client)
+        bump_world_version(self._pb_client)
 
     def remove_collision_objects(self):
         if self.camera_collision_obj is not None:
@@ -220,6 +222,7 @@ class Camera:
             pb.removeBody(self.rod_collision_obj,
                           physicsClientId=self._pb_client)
             self.rod_collision_obj = None
+        bump_world_version(self._pb_client)
 
     def start_recording(self, duration):
         '''Starts recording on camera
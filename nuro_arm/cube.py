@@ -5,6 +5,7 @@ import cv2
 import numpy as np
 
 from nuro_arm.constants import URDF_DIR, CUBE_SIZE
+from nuro_arm.world_version import bump_world_version
 
 class Cube:
     def __init__(self,
@@ -24,6 +25,7 @@ class Cube:
                               rot,
                               globalScaling=self.size,
                               physicsClientId=pb_client)
+        bump_world_version(self.client)
         if tag_id is not None:
             self.add_aruco_tag(tag_id, rgba)
         else:
@@ -43,6 +45,7 @@ class Cube:
         '''
         pb.resetBasePositionAndOrientation(self.id, pos, rot, self.client)
         pb.resetBaseVelocity(self.id, [0,0,0],[0,0,0], self.client)
+        bump_world_version(self.client)
 
     def get_pose(self):
         '''Get pose of cube
@@ -112,6 +115,7 @@ class Cube:
 
     def delete(self):
         pb.removeBody(self.id, physicsClientId=self.client)
+        bump_world_version(self.client)
 
     def __hash__(self):
         return self.id
@@ -0,0 +1,321 @@
+import os
+import stat
+import tempfile
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+from nuro_arm.robot.base_controller import BaseController
+from nuro_arm.robot.xarm_controller import XArmController
+from nuro_arm.robot.xarm_errors import XArmConnectionError
+
+# methods of XArmController that clients may call
+REMOTE_METHODS = ('read_jpos', 'write_jpos', 'execute_trajectory',
+                  'power_on_servos', 'power_off_servos', 'power_on_servo',
+                  'power_off_servo', 'stop_servos', 'get_joint_id',
+                  'get_joint_name', 'get_telemetry', 'get_io_stats',
+                  'get_latency_stats', 'read_voltage', 'get_health',
+                  'read_arm_state', 'estimate_jpos')
+
+# attributes of XArmController that are copied to clients when they connect
+REMOTE_ATTRIBUTES = ('joint_names', 'arm_joint_ids', 'gripper_joint_ids',
+                     'servo_ids', 'arm_joint_limits', 'gripper_joint_limits',
+                     'arm_jpos_home', 'movement_precision',
+                     'measurement_precision', 'measurement_frequency',
+                     'dense_monitor_period', 'motion_latency',
+                     'default_speed', 'min_speed', 'max_speed', 'serial_number')
+
+def get_daemon_dir():
+    '''Private directory of the arm daemon, in XDG_RUNTIME_DIR if it is set,
+    otherwise in the temporary directory with the user id in its name
+
+    Returns
+    -------
+    str
+    '''
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'nuro_arm')
+    return os.path.join(tempfile.gettempdir(), f'nuro_arm-{os.getuid()}')
+
+def get_daemon_address():
+    '''Default unix socket on which the arm daemon serves clients, the
+    authentication key is stored next to it with the '.key' suffix
+
+    Returns
+    -------
+    str
+    '''
+    return os.path.join(get_daemon_dir(), 'xarm.sock')
+
+def _make_private_dir(path):
+    '''Create directory that only the current user can access.  The default
+    directory must not have been created by another user, since it is in a
+    shared location when XDG_RUNTIME_DIR is not set
+    '''
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if os.path.abspath(path) != os.path.abspath(get_daemon_dir()):
+        return
+    st = os.stat(path)
+    if st.st_uid != os.getuid() or st.st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+        raise XArmConnectionError(f'{path} must be owned by the current user, and'
+                                  ' not accessible by others')
+
+def _write_private_file(path, data):
+    '''Write data to a new file that only the current user can read
+    '''
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+
+class ArmDaemon:
+    def __init__(self,
+                 serial_number=None,
+                 device=None,
+                 address=None,
+                 telemetry_rate=50,
+                ):
+        '''Long-running owner of an xArm that serves commands from clients in
+        other processes over a unix socket, see RemoteController.  Telemetry is
+        kept running, so clients can read joint positions at telemetry rate
+        without waiting on the usb connection
+
+        Parameters
+        ----------
+        serial_number : str, optional
+            serial number of xArm to connect to
+        device : obj, optional
+            already opened device, see XArmController
+        address : str, optional
+            path of unix socket on which clients are served, defaults to
+            get_daemon_address().  clients must
+            authenticate with a random key that is written to address + '.key',
+            readable only by the current user
+        telemetry_rate : float, default to 50
+            frequency (Hz) at which joint positions are polled
+
+        Raises
+        ------
+        XArmConnectionError
+            If another daemon is already serving on address, or the socket
+            cannot be created there
+        '''
+        if address is None:
+            address = get_daemon_address()
+        _make_private_dir(os.path.dirname(address) or '.')
+        if os.path.exists(address):
+            try:
+                Client(address, family='AF_UNIX').close()
+            except OSError:
+                # left behind by a daemon that did not shut down cleanly
+                try:
+                    os.remove(address)
+                except OSError as e:
+                    raise XArmConnectionError(f'Unable to remove stale socket {address}'
+                                              f' ({e}). Remove it, or serve on'
+                                              ' another address.')
+            else:
+                raise XArmConnectionError(f'Arm daemon is already running on {address}')
+
+        self.address = address
+        self.authkey_file = address + '.key'
+        authkey = os.urandom(32)
+        try:
+            _write_private_file(self.authkey_file, authkey)
+        except OSError as e:
+            raise XArmConnectionError(f'Unable to write key file {self.authkey_file}'
+                                      f' ({e}). Remove it, or serve on another'
+                                      ' address.')
+
+        self.controller = XArmController(serial_number, device)
+        self.controller.start_telemetry(telemetry_rate)
+        self.listener = Listener(address, family='AF_UNIX', authkey=authkey)
+        self._closed = False
+
+    def serve_forever(self):
+        '''Accept clients until the daemon is closed, each client is served by
+        its own thread
+        '''
+        print(f'Serving xArm {self.controller.serial_number} on {self.address}')
+        while not self._closed:
+            try:
+                conn = self.listener.accept()
+            except (AuthenticationError, EOFError, OSError):
+                if self._closed:
+                    break
+                # client did not have the key, or hung up during handshake
+                continue
+            threading.Thread(target=self._serve_client,
+                             args=(conn,),
+                             daemon=True).start()
+
+    def close(self):
+        '''Stop accepting clients and disconnect from the xArm
+        '''
+        if self._closed:
+            return
+        self._closed = True
+        self.listener.close()
+        try:
+            os.remove(self.authkey_file)
+        except OSError:
+            pass
+        self.controller.disconnect()
+
+    def _serve_client(self, conn):
+        with conn:
+            while True:
+                try:
+                    method, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+
+                try:
+                    if method == 'describe':
+                        ret = {k : getattr(self.controller, k) for k in REMOTE_ATTRIBUTES}
+                    elif method in REMOTE_METHODS:
+                        ret = getattr(self.controller, method)(*args, **kwargs)
+                    else:
+                        raise AttributeError(f'{method} cannot be called remotely')
+                    reply = ('ok', ret)
+                except Exception as e:
+                    reply = ('error', e)
+
+                try:
+                    conn.send(reply)
+                except OSError:
+                    return
+
+class RemoteController(BaseController):
+    def __init__(self, address=None):
+        '''Controller for an xArm owned by an ArmDaemon, possibly shared with
+        other processes.  Connecting is cheap since the daemon has already
+        opened the device and synced servo offsets
+
+        Parameters
+        ----------
+        address : str, optional
+            path of unix socket on which daemon is serving, defaults to
+            get_daemon_address().  its key is read from address + '.key'
+
+        Raises
+        ------
+        XArmConnectionError
+            If no daemon is serving on address, or authentication failed
+        '''
+        super().__init__()
+        if address is None:
+            address = get_daemon_address()
+        try:
+            with open(address + '.key', 'rb') as f:
+                authkey = f.read()
+            self._conn = Client(address, family='AF_UNIX', authkey=authkey)
+        except FileNotFoundError:
+            raise XArmConnectionError(f'No arm daemon is running on {address}.'
+                                      ' Start one with the command:\n'
+                                      '         $ xarm_daemon')
+        except (AuthenticationError, PermissionError) as e:
+            raise XArmConnectionError(f'Not allowed to connect to arm daemon on'
+                                      f' {address}: {e}')
+        except (EOFError, OSError):
+            raise XArmConnectionError(f'No arm daemon is running on {address}.'
+                                      ' Start one with the command:\n'
+                                      '         $ xarm_daemon')
+        self._lock = threading.Lock()
+        self.address = address
+        self.is_connected = True
+
+        for name, value in self._call('describe').items():
+            setattr(self, name, value)
+
+    def timestep(self, dt=None):
+        time.sleep(1/self.measurement_frequency if dt is None else dt)
+
+    def disconnect(self):
+        '''Close connection to daemon, the arm is left as it is
+        '''
+        if self.is_connected:
+            self.is_connected = False
+            self._conn.close()
+
+    def read_jpos(self, joint_ids, max_age=None, estimate=False, tolerance=None):
+        '''Read joint positions, answered from the telemetry of the daemon if
+        it is recent enough, see XArmController.read_jpos
+        '''
+        return self._call('read_jpos', joint_ids, max_age, estimate, tolerance)
+
+    def estimate_jpos(self, joint_ids):
+        return self._call('estimate_jpos', joint_ids)
+
+    def read_arm_state(self, max_age=None, estimate=False, tolerance=None):
+        return self._call('read_arm_state', max_age, estimate, tolerance)
+
+    def write_jpos(self, joint_ids, jpos, speed=None, sync=True):
+        return self._call('write_jpos', joint_ids, jpos, speed, sync)
+
+    def execute_trajectory(self, joint_ids, timestamps, jpos):
+        return self._call('execute_trajectory', joint_ids, timestamps, jpos)
+
+    def power_on_servos(self):
+        self._call('power_on_servos')
+
+    def power_off_servos(self):
+        self._call('power_off_servos')
+
+    def power_on_servo(self, joint_id):
+        self._call('power_on_servo', joint_id)
+
+    def power_off_servo(self, joint_id):
+        self._call('power_off_servo', joint_id)
+
+    def stop_servos(self, joint_ids=None):
+        self._call('stop_servos', joint_ids)
+
+    def get_joint_id(self, joint_name):
+        return self._call('get_joint_id', joint_name)
+
+    def get_joint_name(self, joint_id):
+        return self._call('get_joint_name', joint_id)
+
+    def get_telemetry(self):
+        return self._call('get_telemetry')
+
+    def get_io_stats(self):
+        return self._call('get_io_stats')
+
+    def get_latency_stats(self):
+        return self._call('get_latency_stats')
+
+    def read_voltage(self):
+        return self._call('read_voltage')
+
+    def get_health(self):
+        return self._call('get_health')
+
+    def _call(self, method, *args, **kwargs):
+        '''Call method of the daemon's controller and wait for the result,
+        exceptions raised by the daemon are re-raised here
+        '''
+        if not self.is_connected:
+            raise XArmConnectionError('Connection to arm daemon is closed')
+        with self._lock:
+            try:
+                self._conn.send((method, args, kwargs))
+                status, ret = self._conn.recv()
+            except (EOFError, OSError) as e:
+                raise XArmConnectionError(f'Lost connection to arm daemon: {e}')
+        if status == 'error':
+            raise ret
+        return ret
+
+    def __del__(self):
+        try:
+            self.disconnect()
+        except AttributeError:
+            # connection was never established
+            pass
@@ -0,0 +1,175 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from nuro_arm.robot.xarm_controller import XArmController, Device, find_serial_numbers, \
+        NO_DEVICE_MESSAGE
+from nuro_arm.robot.xarm_errors import XArmConnectionError
+
+class ArmPool:
+    def __init__(self, serial_numbers=None, devices=None):
+        '''Manages several xArms connected to the same computer.  Each arm has
+        its own XArmController, whose I/O thread owns its usb device, and
+        commands to all arms are issued concurrently
+
+        Parameters
+        ----------
+        serial_numbers : list of str, optional
+            serial numbers of xArms to connect.  If not provided, all connected
+            xArms are used
+        devices : list of obj, optional
+            already opened devices to use instead of connecting over usb, such
+            as EmulatedDevices
+
+        Raises
+        ------
+        XArmConnectionError
+            If no xArm is found
+
+        Attributes
+        ----------
+        controllers : dict
+            XArmController of each arm, keyed by serial number
+        '''
+        if devices is None:
+            if serial_numbers is None:
+                serial_numbers = find_serial_numbers()
+            devices = []
+            try:
+                for sn in serial_numbers:
+                    devices.append(Device(sn))
+            except Exception:
+                for device in devices:
+                    device.close()
+                raise
+
+        if len(devices) == 0:
+            raise XArmConnectionError(NO_DEVICE_MESSAGE)
+
+        # used to run blocking calls of each controller concurrently
+        self._executor = ThreadPoolExecutor(max_workers=len(devices))
+
+        # connecting syncs offsets of every arm, so do it concurrently
+        futures = [self._executor.submit(XArmController, device=d) for d in devices]
+        controllers, error = [], None
+        for device, future in zip(devices, futures):
+            try:
+                controllers.append(future.result())
+            except Exception as e:
+                device.close()
+                error = error or e
+        if error is not None:
+            # do not leave the arms that connected powered, with their I/O
+            # threads running
+            self.controllers = {c.serial_number : c for c in controllers}
+            self.close()
+            raise error
+        self.controllers = {c.serial_number : c for c in controllers}
+
+    @property
+    def serial_numbers(self):
+        return list(self.controllers.keys())
+
+    def map(self, fn):
+        '''Call function on every controller concurrently
+
+        Parameters
+        ----------
+        fn : callable
+            function that takes an XArmController as its only argument
+
+        Returns
+        -------
+        dict
+            return value of fn for each controller, keyed by serial number
+        '''
+        futures = {sn : self._executor.submit(fn, c)
+                       for sn, c in self.controllers.items()}
+        return {sn : f.result() for sn, f in futures.items()}
+
+    def read_jpos(self, joint_ids=None):
+        '''Read joint positions of all arms concurrently
+
+        Parameters
+        ----------
+        joint_ids : array_like of int, optional
+            joint ids to read, defaults to arm joints
+
+        Returns
+        -------
+        dict
+            joint positions in radians keyed by serial number
+        '''
+        return self.map(lambda c: c.read_jpos(c.arm_joint_ids if joint_ids is None
+                                                  else joint_ids))
+
+    def write_jpos(self, joint_ids, jpos, speed=None, synchronized=False):
+        '''Move joints of all arms
+
+        Parameters
+        ----------
+        joint_ids : array_like of int
+            joint ids to be moved
+        jpos : array_like of float or dict
+            target joint positions in radians. if dict, targets are specified
+            per arm keyed by serial number, otherwise all arms move to the
+            same target
+        speed : float, optional
+            joint speed in radians per second
+        synchronized : bool, default=False
+            if True, all arms use the duration of the slowest move and their
+            move commands are queued back to back from a single thread, so
+            they are sent within one scheduling tick.  if False, each arm
+            moves at its own pace and commands are issued concurrently
+
+        Returns
+        -------
+        float
+            expected time (s) to complete slowest movement
+        '''
+        if not isinstance(jpos, dict):
+            jpos = {sn : jpos for sn in self.controllers}
+
+        if not synchronized:
+            durations = self.map(lambda c: c.write_jpos(joint_ids,
+                                                        jpos[c.serial_number],
+                                                        speed))
+            return max(durations.values())
+
+        current_jpos = self.read_jpos(joint_ids)
+        duration_ms = 0
+        for sn, c in self.controllers.items():
+            arm_speed = np.clip(c.default_speed if speed is None else speed,
+                                c.min_speed, c.max_speed)
+            delta_jpos = np.abs(np.subtract(jpos[sn], current_jpos[sn]))
+            duration_ms = max(duration_ms, int(1000 * np.max(delta_jpos / arm_speed)))
+
+        transactions = [c.move_servos(joint_ids, jpos[sn], duration_ms, wait=False)
+                            for sn, c in self.controllers.items()]
+        [t.wait() for t in transactions]
+        return duration_ms / 1000.
+
+    def power_on_servos(self):
+        self.map(lambda c: c.power_on_servos())
+
+    def power_off_servos(self):
+        self.map(lambda c: c.power_off_servos())
+
+    def stop_servos(self):
+        self.map(lambda c: c.stop_servos())
+
+    def close(self):
+        '''Turn off servos and disconnect from all arms
+        '''
+        self.map(lambda c: c.power_off_servos())
+        self.map(lambda c: c.disconnect())
+        self._executor.shutdown()
+        self.controllers = {}
+
+    def __getitem__(self, serial_number):
+        return self.controllers[serial_number]
+
+    def __len__(self):
+        return len(self.controllers)
+
+    def __iter__(self):
+        return iter(self.controllers.values())
@@ -0,0 +1,51 @@
+import numpy as np
+
+class ArmState:
+    __slots__ = ('timestamp', 'arm_jpos', 'gripper_state', 'source')
+
+    def __init__(self, timestamp, arm_jpos, gripper_state, source):
+        '''Immutable snapshot of arm joint positions and gripper state, taken
+        at the same instant
+
+        Parameters
+        ----------
+        timestamp : float
+            time.monotonic() at which the state was measured
+        arm_jpos : array_like of float
+            arm joint positions in radians, ordered from base to wristRotation
+        gripper_state : float
+            gripper state from 0 (fully closed) to 1 (fully opened)
+        source : str
+            where the state came from, e.g. 'xarm', 'telemetry' or 'sim'
+        '''
+        arm_jpos = np.array(arm_jpos, dtype=float)
+        arm_jpos.setflags(write=False)
+        object.__setattr__(self, 'timestamp', timestamp)
+        object.__setattr__(self, 'arm_jpos', arm_jpos)
+        object.__setattr__(self, 'gripper_state', float(gripper_state))
+        object.__setattr__(self, 'source', source)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ArmState is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('ArmState is immutable')
+
+    def __reduce__(self):
+        return (ArmState, (self.timestamp, self.arm_jpos,
+                           self.gripper_state, self.source))
+
+    def as_array(self):
+        '''Arm joint positions followed by gripper state
+
+        Returns
+        -------
+        ndarray
+            shape=(6,); dtype=float
+        '''
+        return np.append(self.arm_jpos, self.gripper_state)
+
+    def __repr__(self):
+        jpos = ', '.join(f'{j:.3f}' for j in self.arm_jpos)
+        return f'ArmState(arm_jpos=[{jpos}], gripper_state={self.gripper_state:.3f},' \
+               f' source={self.source}, timestamp={self.timestamp:.3f})'
@@ -0,0 +1,182 @@
+import asyncio
+import numpy as np
+
+from nuro_arm.robot.robot_arm import RobotArm
+
+class AsyncRobotArm:
+    GRIPPER_CLOSED = RobotArm.GRIPPER_CLOSED
+    GRIPPER_OPENED = RobotArm.GRIPPER_OPENED
+    def __init__(self, *args, **kwargs):
+        '''asyncio interface to the xArm.  Moves, reads and gripper commands
+        are coroutines, so perception, planning and motion can run concurrently
+        on one event loop.  Awaiting a move does not block the loop: the real
+        xArm is read without blocking, and the simulator is stepped on the loop
+
+        A move that is cancelled stops the joints where they are.  Arm and
+        gripper may be moved concurrently, but concurrent moves of the same
+        joints will interfere with each other
+
+        Accepts the same arguments as RobotArm
+
+        Attributes
+        ----------
+        robot : RobotArm
+            synchronous interface, used for planning and safety checks
+        controller : BaseController
+            controller used to execute motion commands
+        mp : MotionPlanner
+        '''
+        self.robot = RobotArm(*args, **kwargs)
+        self.controller = self.robot.controller
+        self.mp = self.robot.mp
+
+    async def home(self):
+        '''Moves to home arm positions
+        '''
+        return await self.move_arm_jpos(self.controller.arm_jpos_home)
+
+    def passive_mode(self):
+        self.controller.power_off_servos()
+
+    def active_mode(self):
+        self.controller.power_on_servos()
+
+    async def get_arm_jpos(self):
+        '''Get positions of the arm joints
+
+        Returns
+        -------
+        ndarray
+            joint angles in radians; shape=(5,); dtype=float
+        '''
+        return await self.controller.async_read_jpos(self.controller.arm_joint_ids)
+
+    async def get_gripper_state(self):
+        '''Get state of gripper
+
+        Returns
+        -------
+        float
+            value in range [0,1] describing how close to open(1) or closed(0)
+            the gripper is
+        '''
+        gripper_jpos = await self.controller.async_read_jpos(self.controller.gripper_joint_ids)
+        return np.clip(self.controller._gripper_jpos_to_state(gripper_jpos), 0, 1)
+
+    async def move_arm_jpos(self, jpos, speed=None):
+        '''Moves arm joints to specific positions, see RobotArm.move_arm_jpos
+
+        Returns
+        -------
+        bool
+            True if joint angles were achieved
+        '''
+        joint_ids = self.controller.arm_joint_ids
+        current_jpos = await self.get_arm_jpos()
+        is_free, collisions = await self._run_planner(self.mp.is_collision_free_trajectory,
+                                                      current_jpos, jpos)
+        if not is_free:
+            print(f"[MOVE FAILED] Trajectory would result in collision: {collisions[0]}")
+            return False
+
+        try:
+            duration = await self.controller.async_write_jpos(joint_ids, jpos, speed)
+            success, achieved_jpos = await self.controller.async_monitor(joint_ids,
+                                                                         jpos,
+                                                                         duration)
+        except asyncio.CancelledError:
+            self._stop(joint_ids)
+            raise
+
+        if not success:
+            # to avoid leaving motors under load, move to achieved jpos
+            await self.controller.async_write_jpos(joint_ids, achieved_jpos)
+
+        await self._run_planner(self.robot.mirror_planner)
+        return success
+
+    async def move_hand_to(self, pos, pitch_roll=None, speed=None, **ik_kwargs):
+        '''Moves end effector to desired pose in world, see
+        RobotArm.move_hand_to
+
+        Returns
+        -------
+        bool
+            True if joint angles returned from IK were achieved
+        '''
+        jpos, ik_info = await self._run_planner(self.robot._solve_hand_ik,
+                                                pos, pitch_roll, **ik_kwargs)
+        return await self.move_arm_jpos(jpos, speed)
+
+    async def open_gripper(self):
+        '''Opens gripper completely
+
+        Returns
+        -------
+        float
+            gripper state that is achieved
+        '''
+        return await self.set_gripper_state(self.GRIPPER_OPENED)
+
+    async def close_gripper(self):
+        '''Closes gripper completely
+
+        Returns
+        -------
+        float
+            gripper state that is achieved
+        '''
+        return await self.set_gripper_state(self.GRIPPER_CLOSED, backoff=-0.05)
+
+    async def set_gripper_state(self, state, backoff=-0.05, speed=None):
+        '''Moves gripper to state, see RobotArm.set_gripper_state
+
+        Returns
+        -------
+        float
+            gripper state that is achieved
+        '''
+        joint_ids = self.controller.gripper_joint_ids
+        state = np.clip(state, 0, 1)
+        gripper_jpos = self.controller._gripper_state_to_jpos(state)
+
+        try:
+            duration = await self.controller.async_write_jpos(joint_ids,
+                                                              gripper_jpos,
+                                                              speed)
+            success, achieved_jpos = await self.controller.async_monitor(joint_ids,
+                                                                         gripper_jpos,
+                                                                         duration)
+        except asyncio.CancelledError:
+            self._stop(joint_ids)
+            raise
+
+        if not success:
+            # to avoid leaving motors under load, move to achieved jpos
+            achieved_state = self.controller._gripper_jpos_to_state(achieved_jpos)
+            achieved_state += backoff
+            achieved_jpos = self.controller._gripper_state_to_jpos(np.clip(achieved_state, 0, 1))
+            await self.controller.async_write_jpos(joint_ids, achieved_jpos)
+            await self.controller.async_timestep()
+
+        achieved_gripper_state = await self.get_gripper_state()
+        await self._run_planner(self.robot.mirror_planner)
+        return achieved_gripper_state
+
+    async def _run_planner(self, fn, *args, **kwargs):
+        '''Run planner call on the default executor while holding the planner
+        lock, so pybullet checks do not block the event loop and do not
+        interleave with other users of the planner
+        '''
+        def run():
+            with self.robot._planner_lock:
+                return fn(*args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(None, run)
+
+    def _stop(self, joint_ids):
+        '''Hold joints at their current positions, used when a move is
+        cancelled.  Blocks briefly since a cancelled task cannot await
+        '''
+        jpos = self.controller.read_jpos(joint_ids)
+        self.controller.write_jpos(joint_ids, jpos)
+        self.robot.mirror_planner()
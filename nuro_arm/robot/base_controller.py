@@ -1,9 +1,16 @@
+import asyncio
 import numpy as np
 import time
 
 from abc import abstractmethod
 
+from nuro_arm.robot.arm_state import ArmState
+from nuro_arm.robot.motion_monitor import MotionMonitor
+
 class BaseController:
+    # reported as source of ArmState
+    STATE_SOURCE = None
+
     def __init__(self):
         '''Base class for controller to implement move and read commands
         '''
@@ -21,8 +28,16 @@ class BaseController:
         self.movement_precision = 1e-4
         self.measurement_precision = 1e-4
         self.measurement_frequency = 10
-
+        # time (s) between polls near the end of a monitored movement, and
+        # time (s) for joints to start moving after a command
+        self.dense_monitor_period = 0.02
+        self.motion_latency = 0.
+        # joints that stalled during the last monitored movement
+        self.stalled_joint_ids = []
+
+        # speed in radians per second
         self.default_speed = 0.8
+        self.max_speed = 4.0
 
     def read_arm_jpos(self):
         '''Get current joint positions of arm servos
@@ -47,6 +62,31 @@ class BaseController:
         gripper_state = np.clip(gripper_state, 0, 1)
         return gripper_state
 
+    def read_arm_state(self, estimate=False):
+        '''Read arm joint positions and gripper state together, with a single
+        read of all servos
+
+        Parameters
+        ----------
+        estimate : bool, default=False
+            if True, controllers that can predict joint positions may return
+            a prediction instead of reading the servos.  ignored by default
+
+        Returns
+        -------
+        ArmState
+        '''
+        timestamp = time.monotonic()
+        jpos = self.read_jpos(list(self.arm_joint_ids) + list(self.gripper_joint_ids))
+        return self._make_arm_state(timestamp, jpos, self.STATE_SOURCE)
+
+    def _make_arm_state(self, timestamp, jpos, source):
+        '''Split joint positions of arm followed by gripper into ArmState
+        '''
+        n_arm = len(self.arm_joint_ids)
+        gripper_state = self._gripper_jpos_to_state(np.asarray(jpos[n_arm:]))
+        return ArmState(timestamp, jpos[:n_arm], np.clip(gripper_state, 0, 1), source)
+
     def write_arm_jpos(self, jpos, speed=None):
         '''Send movement command to arm servos
 
@@ -86,12 +126,26 @@ class BaseController:
         return self.write_jpos(self.gripper_joint_ids, gripper_jpos, speed)
 
     @abstractmethod
-    def timestep(self):
+    def timestep(self, dt=None):
         '''Used for monitoring movements, either waits some time or steps simulator
         if applicable
+
+        Parameters
+        ----------
+        dt : float, optional
+            time (s) to wait or simulate, defaults to one measurement period
         '''
         pass
 
+    def clock(self):
+        '''Current time (s) of the controller, which advances with timestep
+
+        Returns
+        -------
+        float
+        '''
+        return time.monotonic()
+
     @abstractmethod
     def get_joint_id(self, joint_name):
         '''Get joint id associated with a given joint name
@@ -184,7 +238,38 @@ class BaseController:
         '''
         pass
 
-    def monitor(self, joint_ids, target_jpos, expected_duration):
+    @abstractmethod
+    def execute_trajectory(self, joint_ids, timestamps, jpos):
+        '''Follow time-parameterized joint trajectory, without monitoring
+
+        Parameters
+        ----------
+        joint_ids : array_like of int
+            joint indices
+        timestamps : array_like of float
+            time (s) at which each waypoint should be reached, relative to the
+            first waypoint; shape=(N,)
+        jpos : array_like of float
+            joint positions of each waypoint; shape=(N, len(joint_ids))
+
+        Returns
+        -------
+        ndarray
+            lateness (s) with which move towards each waypoint was commanded;
+            shape=(N-1,)
+        ndarray
+            achieved joint positions after the last waypoint
+        '''
+        pass
+
+    def monitor(self,
+                joint_ids,
+                target_jpos,
+                expected_duration,
+                cancel_event=None,
+                precision=None,
+                abort_on_stall=None,
+               ):
         '''Monitor arm movement to detect failure or collision
 
         With simulated controller, failure indicates collision.  With xArm, it
@@ -192,6 +277,12 @@ class BaseController:
         tune the precision values, however the gripper is especially inaccurate
         for some reason).
 
+        Polls are scheduled from the expected duration: sparse while the
+        movement is in progress and dense near its predicted arrival.  Stalls
+        are detected per joint by comparing progress against the commanded
+        profile, see MotionMonitor.  Joints that stalled are stored in
+        stalled_joint_ids.
+
         Parameters
         ----------
         j_idxs : array_like of int
@@ -201,7 +292,19 @@ class BaseController:
             target joint positions in radians, length should match j_idxs
         duration : float
             number of seconds that the movement is expected to take. a movement
-            will be labeled a failure if it takes longer than 1.5x duration
+            will be labeled a failure if it takes longer than 1.5x duration,
+            plus the motion latency of the controller
+        cancel_event : threading.Event, optional
+            if set, monitoring stops at the next poll and the movement is
+            labeled a failure
+        precision : float, optional
+            tolerance (radians) within which target is considered reached,
+            defaults to movement_precision.  A larger value ends monitoring
+            while the joints are still approaching the target
+        abort_on_stall : array_like of bool, optional
+            joints whose stall ends the movement, in order of joint_ids.
+            defaults to all joints.  Other joints that stall are still stored
+            in stalled_joint_ids
 
         Returns
         -------
@@ -211,32 +314,79 @@ class BaseController:
             achieved joint position at the end of the motion, may be different
             from target even if successful due to joint precision margin
         '''
-        t_factor = 1.5
-        start_time = time.time()
+        motion = self._start_monitor(joint_ids, target_jpos, expected_duration,
+                                     precision=precision,
+                                     abort_on_stall=abort_on_stall)
+        while True:
+            self.timestep(motion.next_delay(self.clock()))
 
-        jpos = self.read_jpos(joint_ids)
+            success = motion.update(self.clock(), self.read_jpos(joint_ids))
+            if success is not None:
+                self.stalled_joint_ids = self._stalled_joint_ids(joint_ids, motion)
+                return success, motion.jpos
 
-        # give some initial time for motion to start
-        # otherwise, it may terminate prematurely because it detects no motion
-        # this is mainly an issue for the gripper only
-        [self.timestep() for _ in range(4)]
-        while True:
-            self.timestep()
+            if cancel_event is not None and cancel_event.is_set():
+                self.stalled_joint_ids = []
+                return False, motion.jpos
 
-            new_jpos = self.read_jpos(joint_ids)
-            if np.allclose(new_jpos, target_jpos, atol=self.movement_precision):
-                # success
-                return True, np.array(new_jpos)
+    async def async_read_jpos(self, joint_ids):
+        '''Awaitable version of read_jpos.  By default, it is executed
+        directly since it does not block for long
+        '''
+        return self.read_jpos(joint_ids)
 
-            if time.time()-start_time > t_factor * expected_duration:
-                # movement has taken too much time
-                return False, np.array(new_jpos)
+    async def async_write_jpos(self, joint_ids, jpos, speed=None):
+        '''Awaitable version of write_jpos.  By default, it is executed
+        directly since it does not block for long
+        '''
+        return self.write_jpos(joint_ids, jpos, speed)
 
-            if (np.abs(np.subtract(new_jpos, jpos)) < self.measurement_precision).all():
-                # all movements are within measurement precision so motion has stopped
-                return False, np.array(new_jpos)
+    async def async_timestep(self, dt=None):
+        '''Awaitable version of timestep, yields to the event loop while
+        waiting
+        '''
+        await asyncio.sleep(1/self.measurement_frequency if dt is None else dt)
 
-            jpos = new_jpos
+    async def async_monitor(self, joint_ids, target_jpos, expected_duration):
+        '''Awaitable version of monitor, other tasks on the event loop run
+        while the movement is in progress.  see monitor for details
+        '''
+        motion = self._start_monitor(joint_ids, target_jpos, expected_duration,
+                                     await self.async_read_jpos(joint_ids))
+        while True:
+            await self.async_timestep(motion.next_delay(self.clock()))
+
+            success = motion.update(self.clock(), await self.async_read_jpos(joint_ids))
+            if success is not None:
+                self.stalled_joint_ids = self._stalled_joint_ids(joint_ids, motion)
+                return success, motion.jpos
+
+    def _start_monitor(self,
+                       joint_ids,
+                       target_jpos,
+                       expected_duration,
+                       jpos=None,
+                       precision=None,
+                       abort_on_stall=None,
+                      ):
+        '''Create MotionMonitor for movement that was just commanded
+        '''
+        start_time = self.clock()
+        if jpos is None:
+            jpos = self.read_jpos(joint_ids)
+        if precision is None:
+            precision = self.movement_precision
+        return MotionMonitor(target_jpos, jpos, start_time, expected_duration,
+                             precision, self.measurement_precision,
+                             sparse_period=1/self.measurement_frequency,
+                             dense_period=self.dense_monitor_period,
+                             motion_latency=self.motion_latency,
+                             abort_on_stall=abort_on_stall)
+
+    def _stalled_joint_ids(self, joint_ids, motion):
+        '''Joint ids that MotionMonitor found to be stalled
+        '''
+        return [j_id for j_id, stalled in zip(joint_ids, motion.stalled) if stalled]
 
     def _gripper_jpos_to_state(self, jpos):
         '''Convert gripper joint position to state
@@ -0,0 +1,193 @@
+import struct
+import time
+
+from nuro_arm.robot.xarm_errors import XArmConnectionError
+
+# file starts with magic, format version and length of serial number, followed
+# by the serial number of the recorded device
+FILE_HEADER = struct.Struct('<4sBB')
+MAGIC = b'XHID'
+VERSION = 1
+
+# each packet is stored as direction, time (s) since start of recording and
+# length, followed by the raw bytes of the packet
+RECORD = struct.Struct('<BdH')
+WRITE = 0
+READ = 1
+READ_TIMEOUT = 2
+
+class RecordingDevice:
+    def __init__(self, device, path):
+        '''Wraps a device, logging every packet written to or read from it to
+        a binary file that can be played back with ReplayDevice
+
+        Parameters
+        ----------
+        device : obj
+            opened device, see xarm_controller.Device
+        path : str
+            file to which packets are written, overwritten if it exists
+        '''
+        self.device = device
+        self.serial_number = device.serial_number
+        self.type = device.type
+        self.path = path
+
+        serial = self.serial_number.encode()
+        self._file = open(path, 'wb')
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION, len(serial)))
+        self._file.write(serial)
+        self._start_time = time.monotonic()
+
+    def write(self, msg):
+        '''Write message to device, see Device.write
+        '''
+        self._record(WRITE, bytes(msg))
+        self.device.write(msg)
+
+    def read(self, timeout):
+        '''Read message from device, see Device.read
+        '''
+        ret = self.device.read(timeout)
+        if ret:
+            self._record(READ, bytes(ret))
+        else:
+            self._record(READ_TIMEOUT, b'')
+        return ret
+
+    def close(self):
+        self.device.close()
+        if not self._file.closed:
+            self._file.close()
+
+    def _record(self, direction, packet):
+        t = time.monotonic() - self._start_time
+        self._file.write(RECORD.pack(direction, t, len(packet)))
+        self._file.write(packet)
+
+class ReplayDevice:
+    def __init__(self, path, realtime=True):
+        '''Plays back a session recorded with RecordingDevice, with the same
+        interface as Device.  Each write is matched to the next recorded write,
+        and reads return the replies that followed it.  Can be passed to
+        XArmController (or RobotArm) to run the real arm code path offline
+
+        Replay only makes sense if the code issues the same sequence of
+        commands as the recorded session.  Note that servo offsets are only
+        synced once per serial number and process, so a session should not be
+        recorded and replayed by the same process
+
+        Parameters
+        ----------
+        path : str
+            file created by RecordingDevice
+        realtime : bool, default=True
+            if True, each reply is returned no sooner after its write than it
+            was in the recording, so the latency of the device is reproduced.
+            otherwise, replies are returned immediately, and the clock and
+            sleep methods follow the time of the recording without waiting,
+            so XArmController replays as fast as possible
+
+        Raises
+        ------
+        ValueError
+            If file was not created by RecordingDevice
+        '''
+        self.path = path
+        self.realtime = realtime
+        self.type = 0
+
+        self._file = open(path, 'rb')
+        magic, version, serial_len = FILE_HEADER.unpack(self._file.read(FILE_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            self._file.close()
+            raise ValueError(f'{path} is not a recording of xArm HID traffic')
+        self.serial_number = self._file.read(serial_len).decode()
+
+        self._next = self._read_record()
+        # times of last write in the recording, and during replay
+        self._recorded_write_time = 0.
+        self._write_time = time.monotonic()
+        # time in the recording, used as clock when not replaying in realtime
+        self._time = 0.
+        self.is_open = True
+
+    def clock(self):
+        '''Current time (s) of the replay.  When not in realtime, this is the
+        time in the recording of the last packet replayed, advanced by sleep
+
+        Returns
+        -------
+        float
+        '''
+        if self.realtime:
+            return time.monotonic()
+        return self._time
+
+    def sleep(self, dt):
+        '''Wait dt seconds, or only advance the clock when not in realtime
+        '''
+        if self.realtime:
+            time.sleep(dt)
+        else:
+            self._time += dt
+
+    def write(self, msg):
+        '''Match message to next write in recording
+
+        Raises
+        ------
+        XArmConnectionError
+            If the recording is exhausted or the command does not match the
+            recorded one
+        '''
+        # skip replies that were read but not by this replay
+        while self._next is not None and self._next[0] != WRITE:
+            self._next = self._read_record()
+        if self._next is None:
+            raise XArmConnectionError('Replay of HID recording is exhausted')
+
+        _, t, packet = self._next
+        if packet[4] != msg[4]:
+            raise XArmConnectionError(f'Replay diverged from recording: command'
+                                      f' {msg[4]} was sent but {packet[4]} was'
+                                      ' recorded')
+        self._recorded_write_time = t
+        self._write_time = time.monotonic()
+        self._time = max(self._time, t)
+        self._next = self._read_record()
+
+    def read(self, timeout):
+        '''Return next reply in recording, see Device.read
+        '''
+        if self._next is None or self._next[0] == WRITE:
+            # more reads than were recorded, so treat as timeout
+            self.sleep(timeout/1000.)
+            return None
+
+        direction, t, packet = self._next
+        self._next = self._read_record()
+        self._time = max(self._time, t)
+        if self.realtime:
+            delay = self._write_time + t - self._recorded_write_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return packet if direction == READ else None
+
+    def close(self):
+        self.is_open = False
+        self._file.close()
+
+    def _read_record(self):
+        '''Read next packet from file
+
+        Returns
+        -------
+        tuple
+            direction, time and packet, None if end of file was reached
+        '''
+        header = self._file.read(RECORD.size)
+        if len(header) < RECORD.size:
+            return None
+        direction, t, length = RECORD.unpack(header)
+        return direction, t, self._file.read(length)
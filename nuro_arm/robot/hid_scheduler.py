@@ -0,0 +1,330 @@
+import asyncio
+import atexit
+import itertools
+import queue
+import threading
+import time
+import weakref
+
+from nuro_arm.robot.xarm_codec import CMD_NAMES, CmdLib, PacketCodec
+from nuro_arm.robot.xarm_errors import XArmConnectionError, XArmTimeoutError
+
+_open_schedulers = weakref.WeakSet()
+
+# replies listing servo ids, with the entry type used to decode them
+_SERVO_REPLY_TYPES = {CmdLib.POSITION_READ : 'short', CmdLib.OFFSET_READ : 'char'}
+_codec = PacketCodec()
+
+@atexit.register
+def _close_schedulers():
+    '''Daemon threads are frozen during interpreter shutdown, so I/O threads
+    are stopped beforehand.  Later transactions (e.g. turning off servos when a
+    controller is garbage collected) are then executed on the caller's thread
+    '''
+    for scheduler in list(_open_schedulers):
+        scheduler.close()
+
+class Priority:
+    '''Lanes of the transaction scheduler, lower values are served first
+    '''
+    HIGH = 0 # power off and stop commands
+    NORMAL = 1 # commands and reads issued by the user
+    LOW = 2 # background telemetry
+
+class Transaction:
+    def __init__(self, msg, reply_cmd=None, timeout=1000, retries=0):
+        '''Message written to the device, paired with the reply it expects
+
+        Parameters
+        ----------
+        msg : array_like
+            message to be written to device
+        reply_cmd : int, optional
+            command of the reply that should be read after writing msg. if
+            None, no reply is expected
+        timeout : int, default=1000
+            time in milliseconds to wait for reply
+        retries : int, default=0
+            number of times the message is resent if the reply times out or
+            communication fails
+
+        Attributes
+        ----------
+        reply : array_like
+            reply received from device, None if no reply was expected or if
+            it timed out
+        error : Exception
+            exception raised while communicating with device, if any
+        '''
+        self.msg = msg
+        self.reply_cmd = reply_cmd
+        self.timeout = timeout
+        self.retries = retries
+        self.reply = None
+        self.error = None
+        self._submitted = None
+        self._done = threading.Event()
+        self._callbacks = []
+        self._callback_lock = threading.Lock()
+
+    def done(self):
+        '''Returns True if transaction has been completed
+        '''
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        '''Block until transaction is completed
+
+        Parameters
+        ----------
+        timeout : float, optional
+            maximum time in seconds to wait
+
+        Raises
+        ------
+        XArmTimeoutError
+            If no reply was received, even after retrying
+        XArmConnectionError
+            If communication with the device failed
+
+        Returns
+        -------
+        array_like
+            reply from device, None if no reply was expected
+        '''
+        self._done.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.reply
+
+    async def wait_async(self):
+        '''Wait for transaction to complete without blocking the event loop,
+        see wait.  Cancelling the wait does not cancel the transaction
+
+        Returns
+        -------
+        array_like
+            reply from device, None if no reply was expected
+        '''
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve():
+            if not future.done():
+                future.set_result(None)
+
+        def notify(transaction):
+            try:
+                loop.call_soon_threadsafe(resolve)
+            except RuntimeError:
+                # event loop was closed while waiting
+                pass
+
+        self.add_done_callback(notify)
+        await future
+        if self.error is not None:
+            raise self.error
+        return self.reply
+
+    def add_done_callback(self, fn):
+        '''Call fn(transaction) once the transaction is complete.  The callback
+        runs on the I/O thread, or immediately if already complete
+        '''
+        with self._callback_lock:
+            if not self._done.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def _finish(self):
+        with self._callback_lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            fn(self)
+
+class TransactionScheduler:
+    def __init__(self, device, backoff=0.005, latency=None):
+        '''Owns all communication with a HID device.  Transactions are executed
+        one at a time by a dedicated I/O thread, so a reply is always read by
+        the thread that sent its request.  Transactions are served in order of
+        priority, then in order of submission
+
+        Parameters
+        ----------
+        device : obj
+            opened device, see xarm_controller.Device
+        backoff : float, default=0.005
+            time (s) waited before the first retry of a failed transaction,
+            doubled for every subsequent retry
+        latency : LatencyRecorder, optional
+            if provided and enabled, the time each transaction spends queued
+            ('queue_wait') and communicating with the device (name of command)
+            is recorded
+
+        Attributes
+        ----------
+        stats : dict
+            counts of transactions, retries, timeouts, errors, failures and
+            stale replies.  a failure is a transaction that did not succeed
+            after all retries, a stale reply is a late reply to an earlier
+            read that was discarded
+        '''
+        self.device = device
+        self.backoff = backoff
+        self.latency = latency
+        self.stats = dict(transactions=0, retries=0, timeouts=0, errors=0, failures=0,
+                          stale_replies=0)
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._closed = False
+        self._submit_lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        _open_schedulers.add(self)
+
+    def submit(self, msg, reply_cmd=None, timeout=1000, priority=Priority.NORMAL,
+               retries=0):
+        '''Queue transaction without waiting for it to complete
+
+        Parameters
+        ----------
+        msg : array_like
+            message to be written to device
+        reply_cmd : int, optional
+            command of expected reply, None if no reply is expected
+        timeout : int, default=1000
+            time in milliseconds to wait for reply
+        priority : int, default=Priority.NORMAL
+            lane in which transaction is queued
+        retries : int, default=0
+            number of times the message is resent if the reply times out or
+            communication fails
+
+        Returns
+        -------
+        Transaction
+        '''
+        transaction = Transaction(msg, reply_cmd, timeout, retries)
+        if self.latency is not None and self.latency.enabled:
+            transaction._submitted = time.perf_counter()
+        with self._submit_lock:
+            if not self._closed:
+                self._queue.put((priority, next(self._counter), transaction))
+                return transaction
+
+        # I/O thread has stopped, so execute on caller's thread
+        self._execute(transaction)
+        return transaction
+
+    def transact(self, msg, reply_cmd=None, timeout=1000, priority=Priority.NORMAL,
+                 retries=0):
+        '''Queue transaction and block until it is complete, see submit
+
+        Returns
+        -------
+        array_like
+            reply from device, None if no reply was expected
+        '''
+        return self.submit(msg, reply_cmd, timeout, priority, retries).wait()
+
+    def close(self):
+        '''Complete all queued transactions, then stop the I/O thread.  Any
+        transactions submitted afterwards are executed on the caller's thread
+        '''
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put((Priority.LOW+1, next(self._counter), None))
+
+        _open_schedulers.discard(self)
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            _, _, transaction = self._queue.get()
+            if transaction is None:
+                return
+            self._execute(transaction)
+
+    def _execute(self, transaction):
+        with self._io_lock:
+            if transaction._submitted is not None:
+                start = time.perf_counter()
+                self.latency.record('queue_wait', start - transaction._submitted)
+                self._execute_locked(transaction)
+                cmd = transaction.msg[4]
+                self.latency.record(CMD_NAMES.get(cmd, f'CMD_{cmd}'),
+                                    time.perf_counter() - start)
+            else:
+                self._execute_locked(transaction)
+        transaction._finish()
+
+    def _execute_locked(self, transaction):
+        self.stats['transactions'] += 1
+        for attempt in range(transaction.retries+1):
+            if attempt > 0:
+                self.stats['retries'] += 1
+                time.sleep(self.backoff * 2**(attempt-1))
+
+            try:
+                self.device.write(transaction.msg)
+                if transaction.reply_cmd is None:
+                    break
+                transaction.reply = self._read_reply(transaction.msg,
+                                                     transaction.reply_cmd,
+                                                     transaction.timeout)
+            except Exception as e:
+                self.stats['errors'] += 1
+                error = XArmConnectionError(f'Communication with xArm failed: {e}')
+                continue
+
+            if transaction.reply is not None:
+                break
+            self.stats['timeouts'] += 1
+            error = XArmTimeoutError(f'No reply to command {transaction.reply_cmd}'
+                                     f' within {transaction.timeout} ms')
+        else:
+            self.stats['failures'] += 1
+            transaction.error = error
+
+    def _read_reply(self, msg, cmd, timeout):
+        '''Read until the reply to msg arrives, discarding late replies to
+        earlier transactions that timed out.  Replies listing servos must list
+        exactly the servos requested in msg, since a late reply to an earlier
+        read has the same command.  Servos that are not connected do not reply,
+        so if no exact reply arrives before the timeout, the largest reply
+        listing only requested servos is returned
+        '''
+        ret_type = _SERVO_REPLY_TYPES.get(cmd)
+        if ret_type is not None:
+            # message has leading 0, then header, servo count and servo ids
+            requested = set(msg[6:6+msg[5]])
+        partial, n_partial = None, 0
+        deadline = time.monotonic() + timeout / 1000.
+        while True:
+            remaining = int(1000 * (deadline - time.monotonic()))
+            if remaining <= 0:
+                return partial
+            ret = self.device.read(remaining)
+            if not ret:
+                return partial
+            if ret[3] != cmd:
+                continue
+            if ret_type is None:
+                return ret
+
+            replied = set(_codec.decode_servo_ids(ret, ret_type).tolist())
+            if replied == requested:
+                if partial is not None:
+                    self.stats['stale_replies'] += 1
+                return ret
+            if replied < requested and len(replied) > n_partial:
+                if partial is not None:
+                    self.stats['stale_replies'] += 1
+                partial, n_partial = ret, len(replied)
+            else:
+                self.stats['stale_replies'] += 1
@@ -0,0 +1,139 @@
+import numpy as np
+
+class JointStateEstimator:
+    def __init__(self,
+                 n_ids,
+                 precision=1.,
+                 hold_drift=2.,
+                 passive_drift=200.,
+                 tracking_error=0.1,
+                 settle_time=0.2,
+                ):
+        '''Predicts servo positions between reads.  The xArm servos
+        interpolate linearly to the commanded target over the move duration,
+        so the commanded profile is applied to the latest measurement.  The
+        residual between measurement and profile (e.g. lag of the servo) is
+        assumed to close within settle_time after the move ends
+
+        All positions are in servo positional units, and arrays are indexed
+        by servo id
+
+        Parameters
+        ----------
+        n_ids : int
+            one more than the largest servo id
+        precision : float, default=1
+            uncertainty of a measurement
+        hold_drift : float, default=2
+            rate (units/s) at which uncertainty grows for a powered servo
+        passive_drift : float, default=200
+            rate (units/s) at which uncertainty grows for a servo that is
+            powered off, since it can be moved by hand
+        tracking_error : float, default=0.1
+            uncertainty as fraction of the commanded displacement since the
+            last measurement
+        settle_time : float, default=0.2
+            time constant (s) with which residual closes after a move ends
+        '''
+        self.precision = precision
+        self.hold_drift = hold_drift
+        self.passive_drift = passive_drift
+        self.tracking_error = tracking_error
+        self.settle_time = settle_time
+
+        self.measured = np.full(n_ids, np.nan)
+        self.measured_time = np.full(n_ids, -np.inf)
+        self.powered = np.zeros(n_ids, dtype=bool)
+
+        # linear profile of latest move command
+        self.has_command = np.zeros(n_ids, dtype=bool)
+        self.cmd_start = np.zeros(n_ids)
+        self.cmd_target = np.zeros(n_ids)
+        self.cmd_time = np.zeros(n_ids)
+        self.cmd_duration = np.zeros(n_ids)
+
+    def update_measurement(self, servo_ids, pos, t):
+        '''Record positions measured at time t
+        '''
+        servo_ids = np.asarray(servo_ids)
+        self.measured[servo_ids] = pos
+        self.measured_time[servo_ids] = t
+
+    def update_command(self, servo_ids, target, duration, t):
+        '''Record move command issued at time t, with duration in seconds
+        '''
+        servo_ids = np.asarray(servo_ids)
+        start, _ = self.predict(servo_ids, t)
+        # servos that were never measured are assumed to start at the target
+        start = np.where(np.isnan(start), target, start)
+
+        self.has_command[servo_ids] = True
+        self.powered[servo_ids] = True
+        self.cmd_start[servo_ids] = start
+        self.cmd_target[servo_ids] = target
+        self.cmd_time[servo_ids] = t
+        self.cmd_duration[servo_ids] = duration
+
+    def power_off(self, servo_ids):
+        '''Servos no longer follow their commands
+        '''
+        servo_ids = np.asarray(servo_ids)
+        self.has_command[servo_ids] = False
+        self.powered[servo_ids] = False
+
+    def reset(self, servo_ids):
+        '''Forget measurements, e.g. when the reported position changes because
+        the servo offset was written
+        '''
+        servo_ids = np.asarray(servo_ids)
+        self.measured[servo_ids] = np.nan
+        self.measured_time[servo_ids] = -np.inf
+        self.has_command[servo_ids] = False
+
+    def predict(self, servo_ids, t):
+        '''Predict positions at time t
+
+        Returns
+        -------
+        ndarray
+            predicted positions, nan if servo was never measured
+        ndarray
+            bound on error of prediction, inf if servo was never measured
+        '''
+        servo_ids = np.asarray(servo_ids)
+        measured = self.measured[servo_ids]
+        tm = self.measured_time[servo_ids]
+        active = self.has_command[servo_ids]
+
+        drift = np.where(self.powered[servo_ids], self.hold_drift, self.passive_drift)
+        uncertainty = self.precision + drift * np.maximum(t - tm, 0)
+
+        # commanded profile at measurement and now, measurements that precede
+        # the command are compared against its start
+        profile_now = self._profile(servo_ids, t)
+        profile_then = self._profile(servo_ids, tm)
+        residual = measured - profile_then
+
+        end_time = self.cmd_time[servo_ids] + self.cmd_duration[servo_ids]
+        settling = np.maximum(t - np.maximum(end_time, tm), 0)
+        decay = np.exp(-settling / self.settle_time)
+
+        estimate = np.where(active, profile_now + residual * decay, measured)
+        uncertainty = uncertainty + np.where(active,
+                        self.tracking_error * np.abs(profile_now - profile_then)
+                        + np.abs(residual) * np.minimum(decay, 1 - decay),
+                        0)
+        uncertainty = np.where(np.isnan(measured), np.inf, uncertainty)
+        return estimate, uncertainty
+
+    def _profile(self, servo_ids, t):
+        '''Position along linear profile of latest command at time(s) t
+        '''
+        duration = self.cmd_duration[servo_ids]
+        elapsed = t - self.cmd_time[servo_ids]
+        frac = np.clip(np.divide(elapsed, duration,
+                                 out=(elapsed >= 0).astype(float),
+                                 where=duration > 0),
+                       0, 1)
+        start = self.cmd_start[servo_ids]
+        return start + frac * (self.cmd_target[servo_ids] - start)
@@ -0,0 +1,135 @@
+import bisect
+import functools
+import threading
+import time
+import numpy as np
+
+# upper edges (s) of histogram buckets, logarithmically spaced so that each
+# bucket is about 18% wider than the previous one
+BUCKET_EDGES = tuple(np.geomspace(1e-5, 5., num=80).tolist())
+
+class LatencyHistogram:
+    def __init__(self, edges=BUCKET_EDGES):
+        '''Histogram of latencies with fixed buckets, so recording is constant
+        time and memory
+
+        Parameters
+        ----------
+        edges : tuple of float
+            upper edges (s) of buckets, in increasing order.  latencies above
+            the last edge are counted in an overflow bucket
+        '''
+        self.edges = edges
+        self.counts = [0] * (len(edges)+1)
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def record(self, latency):
+        '''Add latency (s) to histogram
+        '''
+        self.counts[bisect.bisect_left(self.edges, latency)] += 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def percentile(self, q):
+        '''Estimate percentile of latencies, as upper edge of the bucket that
+        contains it
+
+        Parameters
+        ----------
+        q : float
+            percentile in range 0 to 100
+
+        Returns
+        -------
+        float
+            latency (s), nan if nothing has been recorded
+        '''
+        if self.count == 0:
+            return float('nan')
+        rank = q / 100. * self.count
+        cumulative = 0
+        for i, c in enumerate(self.counts):
+            cumulative += c
+            if cumulative >= rank and c > 0:
+                return self.edges[i] if i < len(self.edges) else self.max
+        return self.max
+
+    def snapshot(self):
+        '''Summary of recorded latencies
+
+        Returns
+        -------
+        dict
+            count, mean, max and 50th, 90th and 99th percentiles in seconds,
+            along with the raw bucket counts
+        '''
+        return {
+            'count' : self.count,
+            'mean' : self.total / self.count if self.count else float('nan'),
+            'max' : self.max,
+            'p50' : self.percentile(50),
+            'p90' : self.percentile(90),
+            'p99' : self.percentile(99),
+            'counts' : list(self.counts),
+        }
+
+class LatencyRecorder:
+    def __init__(self, enabled=False):
+        '''Collection of latency histograms keyed by name.  Recording is off by
+        default; instrumented code checks `enabled` before taking any
+        timestamps, so the overhead is negligible when disabled
+
+        Parameters
+        ----------
+        enabled : bool, default=False
+            whether latencies should be recorded
+        '''
+        self.enabled = enabled
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, latency):
+        '''Add latency (s) to histogram of the given name
+        '''
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = LatencyHistogram()
+            histogram.record(latency)
+
+    def snapshot(self):
+        '''Summaries of all histograms, see LatencyHistogram.snapshot
+
+        Returns
+        -------
+        dict
+            summary of each histogram keyed by name
+        '''
+        with self._lock:
+            return {name : h.snapshot() for name, h in self._histograms.items()}
+
+    def reset(self):
+        '''Clear all histograms
+        '''
+        with self._lock:
+            self._histograms = {}
+
+def timed(name):
+    '''Decorator for methods that records their latency in `self.latency`, a
+    LatencyRecorder, when it is enabled
+    '''
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            if not self.latency.enabled:
+                return fn(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(self, *args, **kwargs)
+            finally:
+                self.latency.record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,77 @@
+class MotionHandle:
+    def __init__(self, future, cancel_event):
+        '''Handle to a motion that is queued or running on the motion executor
+        of RobotArm, see RobotArm.move_arm_jpos_async
+
+        Parameters
+        ----------
+        future : concurrent.futures.Future
+            resolves to the return value of the motion and the ArmState
+            measured once it finished
+        cancel_event : threading.Event
+            set to stop the motion while it is monitored
+        '''
+        self._future = future
+        self._cancel_event = cancel_event
+
+    def done(self):
+        '''Returns True if motion has finished or was cancelled
+        '''
+        return self._future.done()
+
+    def cancelled(self):
+        '''Returns True if motion was cancelled before it started
+        '''
+        return self._future.cancelled()
+
+    def wait(self, timeout=None):
+        '''Block until motion has finished
+
+        Parameters
+        ----------
+        timeout : float, optional
+            maximum time in seconds to wait
+
+        Raises
+        ------
+        concurrent.futures.TimeoutError
+            If motion has not finished within timeout
+        concurrent.futures.CancelledError
+            If motion was cancelled before it started
+
+        Returns
+        -------
+        obj
+            return value of the motion, e.g. whether target was achieved
+        '''
+        return self._future.result(timeout)[0]
+
+    def cancel(self):
+        '''Cancel motion.  A queued motion is removed from the queue; a running
+        motion is stopped where it is at its next poll, and reports failure
+
+        Returns
+        -------
+        bool
+            False if motion had already finished
+        '''
+        if self._future.cancel():
+            return True
+        self._cancel_event.set()
+        return not self._future.done()
+
+    @property
+    def achieved_state(self):
+        '''ArmState measured once the motion finished, None if motion has not
+        finished or was cancelled before it started
+        '''
+        if not self._future.done() or self._future.cancelled() \
+                or self._future.exception() is not None:
+            return None
+        return self._future.result()[1]
+
+    def add_done_callback(self, fn):
+        '''Call fn(handle) once the motion has finished or was cancelled.  The
+        callback runs on the motion executor, or immediately if already done
+        '''
+        self._future.add_done_callback(lambda future: fn(self))
@@ -0,0 +1,187 @@
+from collections import deque
+
+import numpy as np
+
+class MotionMonitor:
+    def __init__(self,
+                 target_jpos,
+                 start_jpos,
+                 start_time,
+                 expected_duration,
+                 movement_precision,
+                 measurement_precision,
+                 sparse_period,
+                 dense_period,
+                 motion_latency=0.,
+                 t_factor=1.5,
+                 lag_tolerance=0.1,
+                 stall_samples=2,
+                 abort_on_stall=None,
+                ):
+        '''Decides when to poll a movement and whether it has finished, used
+        by BaseController.monitor.  Polls are sparse while the movement is
+        expected to be in progress, and dense near and after its predicted
+        arrival, so short moves are not slowed down by a fixed polling rate.
+        A joint has stalled, e.g. because of contact, when it has fallen
+        behind the commanded linear profile and has stopped moving for
+        stall_samples consecutive polls.  A movement has also stalled when all
+        joints that have not reached their target stop moving, which is judged
+        from their velocity over the last sparse period.  Stalled joints are
+        reported in the stalled attribute.  Joints excluded by abort_on_stall,
+        e.g. a gripper closing on an object, may stall without failing the
+        movement; it then ends once all other joints reach their target
+
+        Parameters
+        ----------
+        target_jpos : array_like of float
+            target joint positions in radians
+        start_jpos : array_like of float
+            joint positions when movement was commanded
+        start_time : float
+            time (s) at which movement was commanded, on the controller clock
+        expected_duration : float
+            time (s) that movement is expected to take
+        movement_precision : float
+            tolerance (radians) within which target is considered reached
+        measurement_precision : float
+            smallest displacement (radians) that can be measured
+        sparse_period : float
+            time (s) between polls while movement is in progress, also the
+            window over which velocity is measured
+        dense_period : float
+            time (s) between polls near and after predicted arrival, i.e. when
+            joints are expected to be within movement precision of target
+        motion_latency : float, default=0
+            time (s) for joints to start moving after a command
+        t_factor : float, default=1.5
+            movement fails if it takes longer than t_factor times the expected
+            duration, plus motion latency
+        lag_tolerance : float, default=0.1
+            fraction of its distance that a joint may fall behind the profile,
+            in addition to movement precision and the distance covered within
+            the motion latency
+        stall_samples : int, default=2
+            number of consecutive polls on which a joint must be behind the
+            profile and stopped to be considered stalled
+        abort_on_stall : array_like of bool, optional
+            joints whose stall fails the movement, defaults to all joints
+        '''
+        self.target_jpos = np.asarray(target_jpos, dtype=float)
+        self.start_time = start_time
+        self.expected_duration = expected_duration
+        self.movement_precision = movement_precision
+        self.measurement_precision = measurement_precision
+        self.sparse_period = sparse_period
+        self.dense_period = dense_period
+        self.motion_latency = motion_latency
+        self.timeout = t_factor * expected_duration + motion_latency
+        self.stall_samples = stall_samples
+
+        start_jpos = np.asarray(start_jpos, dtype=float)
+        self.start_jpos = start_jpos
+        distance = np.abs(self.target_jpos - start_jpos)
+        self.expected_speed = distance / max(expected_duration, dense_period)
+        self.lag_tolerance = movement_precision + lag_tolerance * distance \
+                + self.expected_speed * motion_latency
+
+        # joints come within movement precision of target before the end of
+        # the movement, which matters when precision is large.  if they are
+        # already within precision, there is no need to wait for them to move
+        frac = np.clip(1 - movement_precision / np.maximum(distance, 1e-12), 0, 1)
+        self.arrival = start_time
+        if (frac > 0).any():
+            self.arrival += motion_latency + expected_duration * frac.max()
+
+        self.jpos = start_jpos
+        self._history = deque([(start_time, start_jpos)])
+        # consecutive polls on which each joint was behind profile and stopped
+        self._stall_counts = np.zeros(len(start_jpos), dtype=int)
+        self.stalled = np.zeros(len(start_jpos), dtype=bool)
+        if abort_on_stall is None:
+            abort_on_stall = np.ones(len(start_jpos), dtype=bool)
+        self.abort_on_stall = np.asarray(abort_on_stall, dtype=bool)
+
+    def next_delay(self, t):
+        '''Time (s) to wait before next poll
+        '''
+        remaining = self.arrival - t
+        if remaining > self.sparse_period:
+            return self.sparse_period
+        return max(remaining, self.dense_period)
+
+    def expected_jpos(self, t):
+        '''Joint positions at time t along the commanded linear profile
+        '''
+        elapsed = t - self.start_time - self.motion_latency
+        frac = np.clip(elapsed / max(self.expected_duration, 1e-6), 0, 1)
+        return self.start_jpos + frac * (self.target_jpos - self.start_jpos)
+
+    def update(self, t, jpos):
+        '''Add measurement of joint positions
+
+        Parameters
+        ----------
+        t : float
+            time (s) of measurement, on the controller clock
+        jpos : array_like of float
+
+        Returns
+        -------
+        bool
+            True if target was reached, False if movement failed, None if
+            movement is still in progress
+        '''
+        self.jpos = np.asarray(jpos, dtype=float)
+        error = np.abs(self.target_jpos - self.jpos)
+        if (error <= self.movement_precision).all():
+            # success
+            return True
+
+        unfinished = error > self.movement_precision
+        elapsed = t - self.start_time
+        if elapsed > self.timeout:
+            # movement has taken too much time
+            return False
+
+        # per joint, compare progress towards target against the profile and
+        # velocity since last poll against the expected velocity
+        t_prev, jpos_prev = self._history[-1]
+        direction = np.sign(self.target_jpos - self.start_jpos)
+        lag = direction * (self.expected_jpos(t) - self.jpos)
+        stopped = np.abs(self.jpos - jpos_prev) < np.maximum(self.measurement_precision,
+                                    0.25 * self.expected_speed * (t - t_prev))
+        behind = unfinished & (lag > self.lag_tolerance) & stopped
+        self._stall_counts = np.where(behind, self._stall_counts + 1, 0)
+        self.stalled |= self._stall_counts >= self.stall_samples
+        if (self.stalled & self.abort_on_stall).any():
+            # joint is blocked, e.g. by contact with an object
+            return False
+        if not (unfinished & ~self.stalled).any():
+            # only joints that may stall are left, they will not reach target
+            return False
+
+        # measure displacement over at least one sparse period
+        self._history.append((t, self.jpos))
+        while len(self._history) > 2 and t - self._history[1][0] >= self.sparse_period:
+            self._history.popleft()
+        t_old, jpos_old = self._history[0]
+        window = t - t_old
+        if elapsed < self.motion_latency + self.sparse_period or window < self.sparse_period:
+            # too early to judge whether joints are moving
+            return None
+
+        displacement = np.abs(self.jpos - jpos_old)
+        threshold = np.full(len(displacement), self.measurement_precision)
+        if elapsed < self.motion_latency + self.expected_duration:
+            # during the movement, moving at a quarter of the expected speed is
+            # considered stopped. afterwards, joints may slow down as they
+            # settle, so any measurable motion counts
+            threshold = np.maximum(threshold, 0.25 * self.expected_speed * window)
+        stopped = unfinished & (displacement < threshold)
+        if (stopped == unfinished).all():
+            # joints that have not reached target have stopped moving, so
+            # they are blocked even if they are close to the profile
+            self.stalled |= stopped
+            return False
+
+        return None
@@ -1,6 +1,11 @@
+from collections import deque, OrderedDict
+import itertools
+
 import pybullet as pb
 import numpy as np
 
+from nuro_arm.world_version import get_world_version
+
 class Collision:
     def __init__(self, contact_pt, pb_client):
         '''Performs collision detection and inverse kinematics in
@@ -85,6 +90,19 @@ class MotionPlanner:
             assert (workspace[:,0] <= workspace[:,1]).all(), \
                     "Invalid workspace: first column must be less than second column"
 
+        # max distance (m) that any point on the arm moves between configurations
+        # that are checked for collisions along a trajectory
+        self.collision_resolution = 0.01
+        self.joint_reach = self._compute_joint_reach()
+        self.n_collision_checks = 0
+
+        # collision results are cached by configuration, rounded to the quantum
+        # (radians), and invalidated when bodies are added, removed or moved
+        # through nuro_arm (see world_version)
+        self.collision_cache_size = 4096
+        self.collision_cache_quantum = 0.01
+        self._collision_cache = OrderedDict()
+
     def is_safe_hand_position(self, pos):
         '''Checks if hand position is within workspace
 
@@ -118,8 +136,8 @@ class MotionPlanner:
             True if arm joint configuration is safe, False otherwise.  Safe
             means all joint angles are within specified limits.
         '''
-        return np.bitwise_and(jpos > self.arm_joint_limits[:,0],
-                              jpos < self.arm_joint_limits[:,1]).all()
+        return np.bitwise_and(jpos > self.arm_joint_limits[0],
+                              jpos < self.arm_joint_limits[1]).all()
 
     def is_collision_free(self, jpos, ignore_gripper=True):
         '''Checks if robot configuration is free of collisions with other bodies
@@ -145,20 +163,25 @@ class MotionPlanner:
         '''
         current_joint_states = self.get_joint_states()
 
-        self._teleport_arm(jpos)
-        collisions = self.find_collisions(jpos, ignore_gripper)
+        key = self._collision_key(jpos, ignore_gripper, current_joint_states)
+        collisions = self._collision_cache_get(key)
+        if collisions is None:
+            collisions = self.find_collisions(jpos, ignore_gripper)
+            self._collision_cache_put(key, collisions)
 
-        # reset arm to previous joint states
-        self.set_joint_states(current_joint_states)
+            # reset arm to previous joint states
+            self.set_joint_states(current_joint_states)
         return len(collisions) == 0, collisions
 
     def is_collision_free_trajectory(self,
                                      start_jpos,
                                      end_jpos,
                                      ignore_gripper=True,
-                                     n_substeps=10):
+                                     n_substeps=None):
         '''Checks if a trajectory is free from collisions, by checking a set of
-        intermediate configurations
+        intermediate configurations.  By default, the number of configurations
+        is chosen so that no point on the arm moves more than
+        collision_resolution meters between consecutive configurations
 
         Parameters
         ----------
@@ -167,18 +190,141 @@ class MotionPlanner:
         end_jpos : array_like of float
             joint positions of arm at end of trajectory
         ignore_gripper : bool
-        n_substeps : int, default=10
-            number of collision checking samples taken within trajectory
+        n_substeps : int, optional
+            number of collision checking samples taken within trajectory,
+            overrides collision_resolution
+
+        Returns
+        -------
+        bool
+            True if there are no collisions present, False otherwise
+        list(obj)
+            List of Collision objects describing the first collisions found
+
+        Note
+        ----
+        Joint states are saved once and restored once after all samples are
+        checked.  Samples are checked in bisection order, starting from the
+        middle of the trajectory, so a collision is usually found after few
+        checks.  The number of samples that were checked is stored in
+        n_collision_checks, samples found in the collision cache are not
+        counted
         '''
         #TODO: handle trajectories with differing servo speeds
+        # start from the cache grid, so that samples of repeated trajectories
+        # are the same despite noise in the measured start
+        start_jpos = np.round(np.asarray(start_jpos) / self.collision_cache_quantum) \
+                        * self.collision_cache_quantum
+        if n_substeps is None:
+            n_substeps = self.required_substeps(start_jpos, end_jpos)
         substeps = np.linspace(start_jpos, end_jpos, num=n_substeps, endpoint=True)
 
-        for jpos in substeps:
-            is_free, collision_info = self.is_collision_free(jpos, ignore_gripper)
-            if not is_free:
-                return is_free, collision_info
+        current_joint_states = self.get_joint_states()
 
-        return True, []
+        collisions = []
+        self.n_collision_checks = 0
+        for idx in self._bisection_order(len(substeps)):
+            key = self._collision_key(substeps[idx], ignore_gripper,
+                                      current_joint_states)
+            collisions = self._collision_cache_get(key)
+            if collisions is None:
+                collisions = self.find_collisions(substeps[idx], ignore_gripper)
+                self._collision_cache_put(key, collisions)
+                self.n_collision_checks += 1
+            if len(collisions) > 0:
+                break
+
+        if self.n_collision_checks > 0:
+            # reset arm to previous joint states
+            self.set_joint_states(current_joint_states)
+        return len(collisions) == 0, collisions
+
+    def clear_collision_cache(self):
+        '''Forget cached collision results, e.g. after bodies were moved with
+        pybullet directly instead of through nuro_arm
+        '''
+        self._collision_cache.clear()
+
+    def _collision_key(self, arm_jpos, ignore_gripper, joint_states):
+        '''Key of collision cache: quantized arm joint positions, quantized
+        gripper joint positions taken from joint_states, and world version
+        '''
+        n_arm = len(self.arm_joint_ids)
+        gripper_jpos = [state[0] for state in joint_states[n_arm:]]
+        quantized = np.round(np.concatenate((arm_jpos, gripper_jpos))
+                             / self.collision_cache_quantum).astype(int)
+        return (get_world_version(self._client), ignore_gripper, quantized.tobytes())
+
+    def _collision_cache_get(self, key):
+        '''Cached collisions for key, None if not cached
+        '''
+        collisions = self._collision_cache.get(key)
+        if collisions is not None:
+            self._collision_cache.move_to_end(key)
+        return collisions
+
+    def _collision_cache_put(self, key, collisions):
+        self._collision_cache[key] = collisions
+        if len(self._collision_cache) > self.collision_cache_size:
+            # evict least recently used result
+            self._collision_cache.popitem(last=False)
+
+    def required_substeps(self, start_jpos, end_jpos):
+        '''Number of samples needed to check trajectory at collision_resolution
+
+        A point within distance r of the axis of a joint moves at most r times
+        the change in angle of the joint, so the displacement of any point on
+        the arm is bounded by the sum over joints of reach times change in
+        angle
+
+        Returns
+        -------
+        int
+            number of samples, including start and end of trajectory
+        '''
+        delta = np.abs(np.subtract(end_jpos, start_jpos))
+        max_displacement = np.dot(self.joint_reach, delta)
+        return int(np.ceil(max_displacement / self.collision_resolution)) + 1
+
+    def _compute_joint_reach(self):
+        '''Upper bound on distance from each arm joint to any point on the links
+        it moves, computed from link geometry of the URDF.  The bound for a joint
+        is the distance to the next joint plus the bound of the next joint
+        '''
+        joint_pos = [pb.getLinkState(self.robot_id, j_id, computeForwardKinematics=True,
+                                     physicsClientId=self._client)[4]
+                        for j_id in self.arm_joint_ids]
+
+        # bounding boxes of links moved by the last arm joint contain the links,
+        # so their corners bound the distance to any point on them
+        corners = []
+        for link_id in range(self.arm_joint_ids[-1], self.n_joints):
+            aabb_min, aabb_max = pb.getAABB(self.robot_id, link_id,
+                                            physicsClientId=self._client)
+            corners.extend(itertools.product(*zip(aabb_min, aabb_max)))
+        reach = np.linalg.norm(np.subtract(corners, joint_pos[-1]), axis=1).max()
+
+        joint_reach = [reach]
+        for i in range(len(joint_pos)-2, -1, -1):
+            reach += np.linalg.norm(np.subtract(joint_pos[i+1], joint_pos[i]))
+            joint_reach.insert(0, reach)
+        return np.array(joint_reach)
+
+    def _bisection_order(self, n):
+        '''Indices 0 to n-1, ordered by midpoint first, then midpoints of the
+        remaining halves, and so on
+        '''
+        order = []
+        intervals = deque([(0, n-1)])
+        while intervals:
+            lo, hi = intervals.popleft()
+            if lo > hi:
+                continue
+            mid = (lo + hi) // 2
+            order.append(mid)
+            intervals.append((lo, mid-1))
+            intervals.append((mid+1, hi))
+        return order
 
     def calculate_ik(self,
                      pos,
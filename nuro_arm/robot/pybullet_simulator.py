@@ -5,6 +5,7 @@ import os
 
 import nuro_arm
 from nuro_arm import transformation_utils, constants
+from nuro_arm.world_version import bump_world_version
 
 class PybulletSimulator:
     def __init__(self,
@@ -62,6 +63,7 @@ class PybulletSimulator:
         robot_pos = (0, 0, 0.012)
         robot_rot = (0, 0, 0, 1)
         self.robot_id = self.initialize_robot(robot_pos, robot_rot)
+        bump_world_version(self._client)
         self.n_joints = pb.getNumJoints(self.robot_id,
                                           physicsClientId=self._client)
 
@@ -232,6 +234,7 @@ class PybulletSimulator:
                                            physicsClientId=self._client)
         self.base_pos = pos
         self.base_rot = rot
+        bump_world_version(self._client)
 
     def close(self):
         pb.disconnect(self._client)
@@ -1,4 +1,6 @@
 from typing import Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from scipy.spatial.transform import Rotation as R
 
@@ -6,6 +8,8 @@ from nuro_arm.robot.motion_planner import MotionPlanner
 from nuro_arm.robot.pybullet_simulator import PybulletSimulator
 from nuro_arm.robot.simulator_controller import SimulatorController
 from nuro_arm.robot.xarm_controller import XArmController
+from nuro_arm.robot.arm_daemon import RemoteController
+from nuro_arm.robot.motion_handle import MotionHandle
 
 class RobotArm:
     GRIPPER_CLOSED = 0
@@ -17,13 +21,16 @@ class RobotArm:
                  workspace: Optional[np.ndarray]=None,
                  pb_client: Optional[int]=None,
                  serial_number: Optional[str]=None,
+                 device: Optional[object]=None,
                 ):
         '''Real or simulated xArm robot interface for safe, high-level motion commands
 
         Parameters
         ----------
-        controller_type : str, {'real','sim'}, default to 'real'
-            Indicate whether motor control be sent to a simulator or the real robot
+        controller_type : str, {'real','sim','remote'}, default to 'real'
+            Indicate whether motor control be sent to a simulator or the real robot.
+            'remote' uses a real robot that is owned by an arm daemon, which
+            can be shared by several processes (see xarm_daemon command)
         headless : bool, default to True
             True if pybullet simulator runs in DIRECT mode, False if
             pybullet simulator runs in GUI mode.
@@ -38,6 +45,9 @@ class RobotArm:
             Serial number of xArm robot to connect.  If specified serial number
             is not available, then connection with fail.  If no serial number
             is provided, then whatever xArm is available will be used.
+        device : obj, default to None
+            Device used by the real controller instead of connecting over usb.
+            Pass an EmulatedDevice to run the real controller without hardware.
 
         Attributes
         ---------
@@ -56,19 +66,28 @@ class RobotArm:
                             'wristRotation', 'gripper')
 
         if headless is None:
-            headless = True if controller_type == 'real' else False
+            headless = True if controller_type in ('real', 'remote') else False
 
         self._sim = PybulletSimulator(headless, pb_client)
         self.mp = MotionPlanner(self._sim, workspace)
+        # planner may be used by the motion executor and the caller at once
+        self._planner_lock = threading.RLock()
+        # created when first asynchronous motion is queued
+        self._motion_executor = None
 
         if controller_type == 'real':
-            self.controller = XArmController(serial_number)
+            self.controller = XArmController(serial_number, device)
 
         elif controller_type == 'sim':
-            self.controller = SimulatorController(self._sim, realtime)
+            # planner and controller share the simulated robot
+            self.controller = SimulatorController(self._sim, realtime,
+                                                  lock=self._planner_lock)
+
+        elif controller_type == 'remote':
+            self.controller = RemoteController()
 
         else:
-            raise TypeError('Invalid controller_type argument; must be real or sim.')
+            raise TypeError('Invalid controller_type argument; must be real, sim or remote.')
 
         self.controller_type = controller_type
 
@@ -96,6 +115,25 @@ class RobotArm:
         arm_jpos = self.controller.read_arm_jpos()
         return arm_jpos
 
+    def get_arm_state(self, estimate=False):
+        '''Get positions of the arm joints and state of the gripper, measured
+        together
+
+        Parameters
+        ----------
+        estimate : bool, default=False
+            if True, the xArm controller may return positions predicted from
+            its last reads and commands instead of reading the servos, when
+            they are known within its estimate_tolerance.  Used by high-rate
+            consumers such as mirror_planner
+
+        Returns
+        -------
+        ArmState
+            has arm_jpos, gripper_state, timestamp and source attributes
+        '''
+        return self.controller.read_arm_state(estimate=estimate)
+
     def move_arm_jpos(self, jpos, speed=None):
         '''Moves arm joints to specific positions
 
@@ -113,25 +151,302 @@ class RobotArm:
         bool
             True if joint angles returned from IK were achieved
         '''
+        return self._move_arm_jpos(jpos, speed)
+
+    def move_arm_jpos_async(self, jpos, speed=None):
+        '''Queue movement of arm joints without waiting for it.  Motions are
+        executed one at a time, in order, on a background thread, see
+        move_arm_jpos
+
+        Returns
+        -------
+        MotionHandle
+            wait() returns True if joint angles were achieved
+        '''
+        return self._submit_motion(self._move_arm_jpos, jpos, speed)
+
+    def _move_arm_jpos(self, jpos, speed=None, cancel_event=None):
         current_jpos = self.get_arm_jpos()
-        if not self.mp.is_collision_free_trajectory(current_jpos, jpos):
-            print(f"[MOVE FAILED] Trajectory would result in collision"
-                  f" of robot:{e.robot_link} and {e.other_body}.")
-            return False
+        with self._planner_lock:
+            is_free, collisions = self.mp.is_collision_free_trajectory(current_jpos,
+                                                                       jpos)
+            if not is_free:
+                print(f"[MOVE FAILED] Trajectory would result in collision:"
+                      f" {collisions[0]}.")
+                return False
 
         duration = self.controller.write_arm_jpos(jpos, speed)
         success, achieved_jpos = self.controller.monitor(self.controller.arm_joint_ids,
-                                                         jpos, duration)
+                                                         jpos, duration, cancel_event)
         if not success:
+            self._report_stall()
             # to avoid leaving motors under load, move to achieved jpos
             self.controller.write_arm_jpos(achieved_jpos)
 
         self.mirror_planner()
         return success
 
-    def get_hand_pose(self):
+    def move_full_state(self, arm_jpos, gripper_state, speed=None, backoff=-0.05):
+        '''Moves arm joints and gripper together.  All servos are commanded at
+        once, and monitored in a single pass, so this takes about as long as
+        the slower of move_arm_jpos and set_gripper_state rather than both
+
+        Parameters
+        ----------
+        arm_jpos : ndarray
+            Desired joint angles in radians for each joint in the arm;
+            shape=(5,); dtype=float
+        gripper_state : float
+            gripper state to move to; will be clipped to range [0,1]
+        speed : float
+            joint speed in radians per second
+        backoff : float
+            amount of back off if gripper does not reach its state, e.g. when
+            grasping an object (as fraction of gripper range), see
+            set_gripper_state
+
+        Returns
+        -------
+        bool
+            True if arm joint angles were achieved.  The gripper not reaching
+            its state is not a failure
+        '''
+        return self._move_full_state(arm_jpos, gripper_state, speed, backoff)
+
+    def move_full_state_async(self, arm_jpos, gripper_state, speed=None, backoff=-0.05):
+        '''Queue movement of arm joints and gripper without waiting for it, see
+        move_full_state and move_arm_jpos_async
+
+        Returns
+        -------
+        MotionHandle
+            wait() returns True if arm joint angles were achieved
+        '''
+        return self._submit_motion(self._move_full_state,
+                                   arm_jpos, gripper_state, speed, backoff)
+
+    def _move_full_state(self,
+                         arm_jpos,
+                         gripper_state,
+                         speed=None,
+                         backoff=-0.05,
+                         cancel_event=None,
+                        ):
+        current_jpos = self.get_arm_jpos()
+        with self._planner_lock:
+            is_free, collisions = self.mp.is_collision_free_trajectory(current_jpos,
+                                                                       arm_jpos)
+            if not is_free:
+                print(f"[MOVE FAILED] Trajectory would result in collision:"
+                      f" {collisions[0]}.")
+                return False
+
+        n_arm = len(self.controller.arm_joint_ids)
+        joint_ids = list(self.controller.arm_joint_ids) \
+                        + list(self.controller.gripper_joint_ids)
+        gripper_state = np.clip(gripper_state, 0, 1)
+        jpos = np.concatenate((arm_jpos,
+                               self.controller._gripper_state_to_jpos(gripper_state)))
+
+        # gripper may stall on a grasped object without stopping the arm
+        abort_on_stall = np.arange(len(joint_ids)) < n_arm
+        duration = self.controller.write_jpos(joint_ids, jpos, speed)
+        success, achieved_jpos = self.controller.monitor(joint_ids, jpos, duration,
+                                                         cancel_event,
+                                                         abort_on_stall=abort_on_stall)
+        arm_success = success or np.allclose(achieved_jpos[:n_arm], arm_jpos,
+                                             atol=self.controller.movement_precision)
+        if not arm_success:
+            self._report_stall()
+        if not success:
+            # to avoid leaving motors under load, move to achieved jpos, with
+            # the gripper backed off
+            achieved_state = self.controller._gripper_jpos_to_state(achieved_jpos[n_arm:])
+            achieved_jpos = np.concatenate((achieved_jpos[:n_arm],
+                    self.controller._gripper_state_to_jpos(achieved_state + backoff)))
+            self.controller.write_jpos(joint_ids, achieved_jpos)
+            self.controller.timestep()
+
+        self.mirror_planner()
+        return bool(arm_success)
+
+    def move_arm_jpos_sequence(self, arm_jpos, speed=None, blend_radius=0.1):
+        '''Moves arm joints through a sequence of waypoints without stopping
+        at each one.  The whole path is checked for safety before any motion
+        is commanded, then the next waypoint is commanded as soon as all
+        joints are within blend_radius of the current one.  Only the final
+        waypoint is monitored until it is reached
+
+        Because of blending, the arm cuts corners by up to blend_radius near
+        intermediate waypoints; with a blend_radius of 0, every waypoint is
+        reached within movement precision
+
+        Parameters
+        ----------
+        arm_jpos : array_like of float
+            joint angles in radians for each waypoint; shape=(N,5); dtype=float
+        speed : float or array_like
+            speed of arm joints in radians per second. if float, then all joints
+            will move at the same speed
+        blend_radius : float, default=0.1
+            distance (radians) from an intermediate waypoint, for every joint,
+            at which the next waypoint is commanded
+
+        Returns
+        -------
+        bool
+            True if final waypoint was achieved
+        '''
+        return self._move_arm_jpos_sequence(arm_jpos, speed, blend_radius)
+
+    def move_arm_jpos_sequence_async(self, arm_jpos, speed=None, blend_radius=0.1):
+        '''Queue movement through a sequence of waypoints without waiting for
+        it, see move_arm_jpos_sequence and move_arm_jpos_async
+
+        Returns
+        -------
+        MotionHandle
+            wait() returns True if final waypoint was achieved
+        '''
+        return self._submit_motion(self._move_arm_jpos_sequence,
+                                   arm_jpos, speed, blend_radius)
+
+    def _move_arm_jpos_sequence(self,
+                                arm_jpos,
+                                speed=None,
+                                blend_radius=0.1,
+                                cancel_event=None,
+                               ):
+        arm_jpos = np.asarray(arm_jpos, dtype=float)
+        if len(arm_jpos) == 0:
+            return True
+
+        path = np.vstack((self.get_arm_jpos(), arm_jpos))
+        with self._planner_lock:
+            for i in range(len(arm_jpos)):
+                if not self.mp.is_safe_arm_jpos(path[i+1]):
+                    print(f"[MOVE FAILED] Waypoint {i} exceeds arm joint limits.")
+                    return False
+                is_free, collisions = self.mp.is_collision_free_trajectory(path[i],
+                                                                           path[i+1])
+                if not is_free:
+                    print(f"[MOVE FAILED] Trajectory to waypoint {i} would result"
+                          f" in collision: {collisions[0]}.")
+                    return False
+
+        blend_radius = max(blend_radius, self.controller.movement_precision)
+        for i, jpos in enumerate(arm_jpos):
+            # only the final waypoint has to be reached precisely
+            precision = None if i == len(arm_jpos) - 1 else blend_radius
+            duration = self.controller.write_arm_jpos(jpos, speed)
+            success, achieved_jpos = self.controller.monitor(self.controller.arm_joint_ids,
+                                                             jpos, duration,
+                                                             cancel_event, precision)
+            if not success:
+                self._report_stall()
+                # to avoid leaving motors under load, move to achieved jpos
+                self.controller.write_arm_jpos(achieved_jpos)
+                break
+
+        self.mirror_planner()
+        return success
+
+    def execute_trajectory(self, timestamps, arm_jpos, gripper_states=None):
+        '''Follows time-parameterized trajectory of the arm (and optionally the
+        gripper).  The whole trajectory is checked for safety before any motion
+        is commanded, then it is streamed to the controller without monitoring
+        for collisions, so motion is smooth.  If the arm is not at the first
+        waypoint, it is moved there first
+
+        Parameters
+        ----------
+        timestamps : array_like of float
+            time (s) at which each waypoint should be reached, relative to the
+            first waypoint; shape=(N,); dtype=float
+        arm_jpos : array_like of float
+            joint angles in radians for each waypoint; shape=(N,5); dtype=float
+        gripper_states : array_like of float, optional
+            gripper state for each waypoint; shape=(N,); dtype=float
+
+        Returns
+        -------
+        bool
+            True if final waypoint was achieved
+        dict
+            contains lateness (s) of each streamed command and the achieved
+            arm joint angles
+        '''
+        arm_jpos = np.asarray(arm_jpos, dtype=float)
+        n_arm = len(self.controller.arm_joint_ids)
+        if arm_jpos.ndim != 2 or arm_jpos.shape[1] != n_arm \
+                or len(arm_jpos) != len(timestamps) or len(arm_jpos) == 0:
+            print(f"[MOVE FAILED] Trajectory must have one timestamp and {n_arm}"
+                  f" arm joint angles per waypoint.")
+            return False, {}
+
+        intervals = np.diff(timestamps)
+        if (intervals <= 0).any():
+            print("[MOVE FAILED] Trajectory timestamps must be increasing.")
+            return False, {}
+
+        # all checks are done before any motion is commanded, gripper included
+        joint_ids = list(self.controller.arm_joint_ids)
+        jpos = arm_jpos
+        if gripper_states is not None:
+            if len(gripper_states) != len(arm_jpos):
+                print("[MOVE FAILED] Trajectory must have one gripper state per waypoint.")
+                return False, {}
+            joint_ids += list(self.controller.gripper_joint_ids)
+            gripper_jpos = [self.controller._gripper_state_to_jpos(state)
+                                for state in np.clip(gripper_states, 0, 1)]
+            jpos = np.concatenate((arm_jpos, gripper_jpos), axis=1)
+
+        max_speed = (np.abs(np.diff(jpos, axis=0)) / intervals[:,None]).max(initial=0)
+        if max_speed > self.controller.max_speed:
+            print(f"[MOVE FAILED] Trajectory requires joint speed of {max_speed:.2f}"
+                  f" rad/s, which exceeds limit of {self.controller.max_speed} rad/s.")
+            return False, {}
+
+        with self._planner_lock:
+            for i, waypoint in enumerate(arm_jpos):
+                if not self.mp.is_safe_arm_jpos(waypoint):
+                    print(f"[MOVE FAILED] Waypoint {i} exceeds arm joint limits.")
+                    return False, {}
+                # segment from previous waypoint, first waypoint is checked alone
+                is_free, collisions = self.mp.is_collision_free_trajectory(
+                                            arm_jpos[max(i-1, 0)], waypoint)
+                if not is_free:
+                    print(f"[MOVE FAILED] Trajectory to waypoint {i} would result"
+                          f" in collision: {collisions[0]}.")
+                    return False, {}
+
+        if not np.allclose(self.get_arm_jpos(), arm_jpos[0],
+                           atol=self.controller.movement_precision):
+            if not self.move_arm_jpos(arm_jpos[0]):
+                return False, {}
+
+        if gripper_states is not None:
+            self.set_gripper_state(gripper_states[0])
+
+        lateness, achieved_jpos = self.controller.execute_trajectory(joint_ids,
+                                                                     timestamps,
+                                                                     jpos)
+        achieved_arm_jpos = achieved_jpos[:n_arm]
+        success = np.allclose(achieved_arm_jpos, arm_jpos[-1],
+                              atol=self.controller.movement_precision)
+
         self.mirror_planner()
-        return self._sim.get_hand_pose()
+        info = {
+            'lateness' : lateness,
+            'achieved_arm_jpos' : achieved_arm_jpos,
+        }
+        return success, info
+
+    def get_hand_pose(self):
+        # a background motion may be checking collisions on the same body
+        with self._planner_lock:
+            self.mirror_planner()
+            return self._sim.get_hand_pose()
 
     def move_hand_to(self,
                      pos,
@@ -167,6 +482,47 @@ class RobotArm:
         dict
             contains information about IK solution
         '''
+        jpos, ik_info = self._solve_hand_ik(pos, pitch_roll, **ik_kwargs)
+
+        return self.move_arm_jpos(jpos, speed)
+
+    def move_hand_through(self,
+                          positions,
+                          pitch_roll=None,
+                          speed=None,
+                          blend_radius=0.1,
+                          **ik_kwargs
+                         ):
+        '''Moves end effector through a sequence of positions in world without
+        stopping at each one.  IK is solved for all positions before moving,
+        see move_arm_jpos_sequence
+
+        Parameters
+        ----------
+        positions : array_like
+            desired 3d positions of end effector; shape=(N,3); dtype=float
+        pitch_roll : array_like, optional
+            pitch and roll of end effector, used for all positions
+        speed : float or array_like
+            speed of arm joints in radians per second. if float, then all joints
+            will move at the same speed
+        blend_radius : float, default=0.1
+            distance (radians) from an intermediate waypoint, for every joint,
+            at which the next waypoint is commanded
+
+        Returns
+        -------
+        bool
+            True if joint angles of the final position were achieved
+        '''
+        arm_jpos = [self._solve_hand_ik(pos, pitch_roll, **ik_kwargs)[0]
+                        for pos in positions]
+        return self.move_arm_jpos_sequence(arm_jpos, speed, blend_radius)
+
+    def _solve_hand_ik(self, pos, pitch_roll=None, **ik_kwargs):
+        '''Calculate arm joint positions that achieve end effector pose, see
+        move_hand_to
+        '''
         if pitch_roll is None:
             rot = None
         else:
@@ -175,9 +531,8 @@ class RobotArm:
             rot = R.from_euler('z', yaw) * R.from_euler('YZ', (pitch, roll) )
             rot = rot.as_quat()
 
-        jpos, ik_info = self.mp.calculate_ik(pos, rot, **ik_kwargs)
-
-        return self.move_arm_jpos(jpos, speed)
+        with self._planner_lock:
+            return self.mp.calculate_ik(pos, rot, **ik_kwargs)
 
     def open_gripper(self):
         '''Opens gripper completely
@@ -220,13 +575,28 @@ class RobotArm:
         bool
             gripper state that is achieved
         '''
+        return self._set_gripper_state(state, backoff, speed)
+
+    def set_gripper_state_async(self, state, backoff=-0.05, speed=None):
+        '''Queue gripper movement without waiting for it.  Motions are executed
+        one at a time, in order, on a background thread, see set_gripper_state
+
+        Returns
+        -------
+        MotionHandle
+            wait() returns gripper state that is achieved
+        '''
+        return self._submit_motion(self._set_gripper_state, state, backoff, speed)
+
+    def _set_gripper_state(self, state, backoff=-0.05, speed=None, cancel_event=None):
         state = np.clip(state, 0, 1)
         duration = self.controller.write_gripper_state(state, speed)
 
         gripper_jpos = self.controller._gripper_state_to_jpos(state)
         success, achieved_jpos = self.controller.monitor(self.controller.gripper_joint_ids,
                                                          gripper_jpos,
-                                                         duration)
+                                                         duration,
+                                                         cancel_event)
         if not success:
             # to avoid leaving motors under load, move to achieved jpos
             achieved_state = self.controller._gripper_jpos_to_state(achieved_jpos)
@@ -257,7 +627,47 @@ class RobotArm:
         rot = rot.as_quat()
         pass
 
+    def _report_stall(self):
+        '''Print which joints stalled during the last monitored movement
+        '''
+        arm_joint_ids = list(self.controller.arm_joint_ids)
+        names = [self.joint_names[arm_joint_ids.index(j_id)]
+                     if j_id in arm_joint_ids else 'gripper'
+                     for j_id in self.controller.stalled_joint_ids]
+        if names:
+            print(f"[MOVE FAILED] Joint stalled: {', '.join(dict.fromkeys(names))}.")
+
+    def _submit_motion(self, motion, *args):
+        '''Queue motion on the motion executor
+
+        Parameters
+        ----------
+        motion : callable
+            blocking motion method that accepts cancel_event as its last
+            argument
+        *args
+            arguments of motion, excluding cancel_event
+
+        Returns
+        -------
+        MotionHandle
+        '''
+        if self._motion_executor is None:
+            # a single worker so motions are executed in the order queued
+            self._motion_executor = ThreadPoolExecutor(max_workers=1)
+
+        cancel_event = threading.Event()
+        def run():
+            ret = motion(*args, cancel_event)
+            return ret, self.get_arm_state()
+
+        return MotionHandle(self._motion_executor.submit(run), cancel_event)
+
     def mirror_planner(self):
-        if self.controller_type == 'real':
-            self.mp.mirror(arm_jpos=self.get_arm_jpos(),
-                           gripper_state=self.get_gripper_state())
+        if self.controller_type in ('real', 'remote'):
+            # called after every move, so predicted positions are used when
+            # they are accurate enough, saving a read of all servos
+            state = self.get_arm_state(estimate=True)
+            with self._planner_lock:
+                self.mp.mirror(arm_jpos=state.arm_jpos,
+                               gripper_state=state.gripper_state)
@@ -1,16 +1,26 @@
+import asyncio
+import threading
 import numpy as np
 import pybullet as pb
 import time
 
 from nuro_arm.robot.base_controller import BaseController
+from nuro_arm.world_version import bump_world_version
 
 class SimulatorController(BaseController):
+    STATE_SOURCE = 'sim'
+
     def __init__(self,
                  pb_sim,
                  realtime=True,
+                 lock=None,
                 ):
         BaseController.__init__(self)
 
+        # held while the robot body is stepped or read, so that a planner that
+        # teleports the same body (and restores it) is never observed midway
+        self.lock = threading.RLock() if lock is None else lock
+
         self.pb_sim = pb_sim
         self._unpack_simulator_params()
         self.arm_jpos_home = np.zeros(len(self.arm_joint_ids))
@@ -20,10 +30,43 @@ class SimulatorController(BaseController):
 
         self.position_gain = 0.2
 
-    def timestep(self):
-        [pb.stepSimulation() for _ in range(int(240/self.measurement_frequency))]
+        # time (s) that has been simulated by this controller
+        self._sim_time = 0.
+
+    def timestep(self, dt=None):
+        dt = self._step(dt)
         if self.realtime:
-            time.sleep(1./self.measurement_frequency)
+            time.sleep(dt)
+
+    async def async_timestep(self, dt=None):
+        '''Steps simulator on the event loop, then yields to other tasks
+        '''
+        dt = self._step(dt)
+        await asyncio.sleep(dt if self.realtime else 0)
+
+    def clock(self):
+        '''Simulated time (s), so monitoring does not depend on how fast the
+        simulator runs
+        '''
+        return self._sim_time
+
+    def _step(self, dt=None):
+        '''Step simulator by dt seconds, rounded to a whole number of steps
+
+        Returns
+        -------
+        float
+            time (s) that was simulated
+        '''
+        if dt is None:
+            dt = 1./self.measurement_frequency
+        n_steps = max(1, int(round(240 * dt)))
+        with self.lock:
+            [pb.stepSimulation(self._client) for _ in range(n_steps)]
+            self._sim_time += n_steps / 240.
+            # bodies may have moved
+            bump_world_version(self._client)
+        return n_steps / 240.
 
     def power_on_servos(self):
         '''Turn on all servos so all joints are rigid
@@ -93,22 +136,66 @@ class SimulatorController(BaseController):
         if np.isscalar(speed):
             speed = np.full(len(joint_ids), speed)
 
-        current_jpos = self.read_jpos(joint_ids)
-        duration = np.abs(np.subtract(current_jpos, jpos))/speed
-
-        # in pybullet==3.17, maxVelocity is not exposed in setJointMotorControlArray
-        # so we have to send commands individually
-        for i in range(len(joint_ids)):
-            pb.setJointMotorControl2(self.robot_id,
-                                     joint_ids[i],
-                                     pb.POSITION_CONTROL,
-                                     jpos[i],
-                                     positionGain=self.position_gain,
-                                     maxVelocity=speed[i],
-                                     physicsClientId=self._client
-                                    )
+        with self.lock:
+            current_jpos = self.read_jpos(joint_ids)
+            duration = np.abs(np.subtract(current_jpos, jpos))/speed
+
+            # in pybullet==3.17, maxVelocity is not exposed in setJointMotorControlArray
+            # so we have to send commands individually
+            for i in range(len(joint_ids)):
+                pb.setJointMotorControl2(self.robot_id,
+                                         joint_ids[i],
+                                         pb.POSITION_CONTROL,
+                                         jpos[i],
+                                         positionGain=self.position_gain,
+                                         maxVelocity=speed[i],
+                                         physicsClientId=self._client
+                                        )
         return np.max(duration)
 
+    def execute_trajectory(self, joint_ids, timestamps, jpos):
+        '''Follow time-parameterized joint trajectory, by commanding each
+        waypoint with the speed needed to reach it on time and stepping the
+        simulator until it is due
+
+        Parameters
+        ----------
+        joint_ids : array_like of int
+            joint indices
+        timestamps : array_like of float
+            time (s) at which each waypoint should be reached, relative to the
+            first waypoint; shape=(N,)
+        jpos : array_like of float
+            joint positions of each waypoint in radians; shape=(N, len(joint_ids))
+
+        Returns
+        -------
+        ndarray
+            lateness (s) with which move towards each waypoint was commanded,
+            always zero in simulation; shape=(N-1,)
+        ndarray
+            achieved joint positions after the last waypoint
+        '''
+        timestamps = np.asarray(timestamps, dtype=float) - timestamps[0]
+        jpos = np.asarray(jpos, dtype=float)
+
+        # simulator runs at 240 Hz, round step counts from start to avoid drift
+        sim_steps = np.round(240 * timestamps).astype(int)
+        for i in range(len(timestamps)-1):
+            interval = max(timestamps[i+1] - timestamps[i], 1e-3)
+            speed = np.abs(jpos[i+1] - jpos[i]) / interval
+            with self.lock:
+                self.write_jpos(joint_ids, jpos[i+1], np.maximum(speed, 1e-3))
+
+                [pb.stepSimulation(self._client)
+                     for _ in range(sim_steps[i+1] - sim_steps[i])]
+                self._sim_time += (sim_steps[i+1] - sim_steps[i]) / 240.
+                bump_world_version(self._client)
+            if self.realtime:
+                time.sleep(interval)
+
+        return np.zeros(len(timestamps)-1), np.array(self.read_jpos(joint_ids))
+
     def read_jpos(self, joint_ids):
         '''Read current joint positions
 
@@ -122,10 +209,11 @@ class SimulatorController(BaseController):
         array_like of float
             joint positions in radians in same order as joint_ids
         '''
-        jpos = next(zip(*pb.getJointStates(self.robot_id,
-                                           joint_ids,
-                                           physicsClientId=self._client
-                                          )))
+        with self.lock:
+            jpos = next(zip(*pb.getJointStates(self.robot_id,
+                                               joint_ids,
+                                               physicsClientId=self._client
+                                              )))
         return jpos
 
     def _unpack_simulator_params(self):
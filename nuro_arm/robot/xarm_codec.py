@@ -0,0 +1,205 @@
+import struct
+import threading
+import numpy as np
+
+def itos(v):
+    lsb = v & 0xFF
+    msb = v >> 8
+    return lsb, msb
+
+class CmdLib:
+    SIGNATURE = 85
+    MOVE = 3
+    BATTERY_VOLTAGE = 15
+    POWER_OFF = 20
+    POSITION_READ = 21
+    OFFSET_READ = 23
+    OFFSET_WRITE = 24
+
+# names of commands keyed by value, used to label statistics
+CMD_NAMES = {v : k for k, v in vars(CmdLib).items()
+             if not k.startswith('_') and k != 'SIGNATURE'}
+
+# largest HID report exchanged with the xArm
+MAX_PACKET_SIZE = 64
+
+# layout of (servo id, value) entries in packets
+SHORT_ENTRY = np.dtype([('id', 'u1'), ('value', '<i2')])
+CHAR_ENTRY = np.dtype([('id', 'u1'), ('value', 'u1')])
+
+# leading 0, signature, signature, length, cmd
+HEADER = struct.Struct('<BBBBB')
+# header, then servo count and duration (ms)
+MOVE_HEADER = struct.Struct('<BBBBBBH')
+
+class PacketCodec:
+    def __init__(self):
+        '''Encodes and decodes CmdLib packets using struct and numpy.  Messages
+        are encoded into a reusable buffer owned by the calling thread, so the
+        returned message is only valid until the next encode call on the same
+        thread
+        '''
+        self._local = threading.local()
+
+    def encode(self, cmd, data):
+        '''Encode message for arbitrary command
+
+        Parameters
+        ----------
+        cmd : int
+            command from CmdLib
+        data : array_like of int
+            command parameters, each must fit in one byte
+
+        Returns
+        -------
+        memoryview
+            message with leading 0, see Device.write
+        '''
+        buf, _ = self._buffers()
+        HEADER.pack_into(buf, 0, 0, CmdLib.SIGNATURE, CmdLib.SIGNATURE,
+                         len(data)+2, cmd)
+        buf[HEADER.size:HEADER.size+len(data)] = bytes(data)
+        return memoryview(buf)[:HEADER.size+len(data)]
+
+    def encode_move(self, servo_ids, pos, duration):
+        '''Encode move command for several servos
+
+        Parameters
+        ----------
+        servo_ids : array_like of int
+        pos : array_like of int
+            target positions in positional units
+        duration : int
+            duration of movement in milliseconds
+
+        Returns
+        -------
+        memoryview
+            message with leading 0, see Device.write
+        '''
+        n = len(servo_ids)
+        buf, move_entries = self._buffers()
+        MOVE_HEADER.pack_into(buf, 0, 0, CmdLib.SIGNATURE, CmdLib.SIGNATURE,
+                              3*n+5, CmdLib.MOVE, n, duration)
+        move_entries['id'][:n] = servo_ids
+        move_entries['value'][:n] = pos
+        return memoryview(buf)[:MOVE_HEADER.size+3*n]
+
+    def encode_position_read(self, servo_ids):
+        '''Encode position read command for several servos
+
+        Returns
+        -------
+        memoryview
+            message with leading 0, see Device.write
+        '''
+        return self.encode(CmdLib.POSITION_READ, [len(servo_ids), *servo_ids])
+
+    def decode(self, ret, ret_type):
+        '''Decode values from reply
+
+        Parameters
+        ----------
+        ret : array_like
+            reply read from device
+        ret_type : str, {'short', 'char'}
+            short : -32,768 to 32,767 for positional readings
+            char : -128 to 127 for servo offsets
+
+        Returns
+        -------
+        ndarray
+            values in order they appear in reply
+        '''
+        if not isinstance(ret, (bytes, bytearray, memoryview)):
+            ret = bytes(ret)
+
+        if ret_type == 'short':
+            return np.frombuffer(ret, SHORT_ENTRY, count=ret[4], offset=5)['value']
+        elif ret_type == 'char':
+            values = np.frombuffer(ret, CHAR_ENTRY, count=ret[4], offset=5)['value']
+            values = values.astype(int)
+            return np.where(values < 128, values, values-255)
+        raise TypeError
+
+    def decode_servo_ids(self, ret, ret_type):
+        '''Decode ids of servos included in reply, in order they appear
+
+        Returns
+        -------
+        ndarray
+        '''
+        if not isinstance(ret, (bytes, bytearray, memoryview)):
+            ret = bytes(ret)
+        entry = SHORT_ENTRY if ret_type == 'short' else CHAR_ENTRY
+        return np.frombuffer(ret, entry, count=ret[4], offset=5)['id']
+
+    def decode_voltage(self, ret):
+        '''Decode supply voltage from reply to BATTERY_VOLTAGE
+
+        Returns
+        -------
+        float
+            voltage in volts
+        '''
+        return (ret[4] + (ret[5] << 8)) / 1000.
+
+    def _buffers(self):
+        '''Buffer of calling thread and a structured view of its move entries
+        '''
+        try:
+            return self._local.buffer, self._local.move_entries
+        except AttributeError:
+            buf = bytearray(MAX_PACKET_SIZE)
+            n_entries = (MAX_PACKET_SIZE - MOVE_HEADER.size) // SHORT_ENTRY.itemsize
+            self._local.buffer = buf
+            self._local.move_entries = np.frombuffer(buf, SHORT_ENTRY,
+                                                     count=n_entries,
+                                                     offset=MOVE_HEADER.size)
+            return self._local.buffer, self._local.move_entries
+
+class JointUnitConverter:
+    def __init__(self, servo_ids, directions, home, pos2radians):
+        '''Converts whole vectors of joint positions between radians and servo
+        positional units, using arrays indexed by servo id
+
+        Parameters
+        ----------
+        servo_ids : array_like of int
+        directions : dict
+            direction (1 or -1) keyed by servo id, servos that are not included
+            have direction 1
+        home : int
+            positional unit value at 0 radians
+        pos2radians : float
+            radians per positional unit
+        '''
+        self.directions = np.ones(max(servo_ids)+1)
+        for s_id, direction in directions.items():
+            self.directions[s_id] = direction
+        self.home = np.full(max(servo_ids)+1, home, dtype=float)
+        self.pos2radians = pos2radians
+
+    def to_radians(self, servo_ids, pos):
+        '''Convert positional units to radians
+
+        Returns
+        -------
+        ndarray of float
+        '''
+        servo_ids = np.asarray(servo_ids)
+        return (np.asarray(pos) - self.home[servo_ids]) \
+                * self.pos2radians * self.directions[servo_ids]
+
+    def to_pos_units(self, servo_ids, jpos):
+        '''Convert radians to positional units, does not clip values
+
+        Returns
+        -------
+        ndarray of int
+        '''
+        servo_ids = np.asarray(servo_ids)
+        pos = np.asarray(jpos) * self.directions[servo_ids] / self.pos2radians \
+                + self.home[servo_ids]
+        return pos.astype(int)
@@ -1,24 +1,76 @@
+import itertools
 import os
 import platform
 import time
 import numpy as np
 import threading
+import weakref
 
 from nuro_arm.robot.base_controller import BaseController
+from nuro_arm.robot.hid_scheduler import TransactionScheduler, Priority
+from nuro_arm.robot.latency import LatencyRecorder, timed
+from nuro_arm.robot.xarm_codec import CmdLib, PacketCodec, JointUnitConverter
+from nuro_arm.robot.xarm_errors import (XArmError, XArmConnectionError,
+                                       XArmServoError, XArmTimeoutError)
+from nuro_arm.robot.xarm_health import HealthMonitor
+from nuro_arm.robot.jpos_estimator import JointStateEstimator
 from nuro_arm.constants import XARM_CONFIG_FILE
 
-def itos(v):
-    lsb = v & 0xFF
-    msb = v >> 8
-    return lsb, msb
-
-class CmdLib:
-    SIGNATURE = 85
-    MOVE = 3
-    POWER_OFF = 20
-    POSITION_READ = 21
-    OFFSET_READ = 23
-    OFFSET_WRITE = 24
+def _poll_telemetry(controller_ref, period, stop_event, health_every=None):
+    '''Body of the telemetry thread.  Only a weak reference to the controller
+    is kept between polls so that the controller can still be garbage collected
+    (and its servos turned off) while telemetry is running.  Health is polled
+    once every health_every position polls
+    '''
+    next_time = time.monotonic()
+    for i in itertools.count():
+        if stop_event.is_set():
+            return
+        controller = controller_ref()
+        if controller is None:
+            return
+        controller._update_telemetry()
+        if health_every is not None and i % health_every == 0:
+            controller._update_health()
+        del controller
+
+        next_time += period
+        delay = next_time - time.monotonic()
+        if delay > 0:
+            stop_event.wait(delay)
+        else:
+            # fell behind, do not try to catch up with a burst of reads
+            next_time = time.monotonic()
+
+# usb identifiers of the xArm control board
+XARM_VENDOR_ID = 1155
+XARM_PRODUCT_ID = 22352
+
+NO_DEVICE_MESSAGE = 'No device found. Ensure that the xarm is connected via usb' \
+                    ' cable and the power is on. Turn the xarm off and back on' \
+                    ' again if needed.'
+
+def find_serial_numbers():
+    '''Find serial numbers of all xArms connected via usb
+
+    Raises
+    ------
+    TypeError
+        If operating system is not Darwin, Linux or Windows
+
+    Returns
+    -------
+    list of str
+    '''
+    if platform.system() == 'Linux':
+        import easyhid
+        devices = easyhid.Enumeration().find(vid=XARM_VENDOR_ID, pid=XARM_PRODUCT_ID)
+        return [d.serial_number for d in devices]
+    elif platform.system() in ('Windows', 'Darwin'):
+        import hid
+        return [d['serial_number'] for d in hid.enumerate(XARM_VENDOR_ID, XARM_PRODUCT_ID)]
+    else:
+        raise TypeError('unsupported operating system')
 
 class Device:
     def __init__(self, serial_number=None):
@@ -29,6 +81,9 @@ class Device:
         ------
         TypeError
             If operating system is not Darwin, Linux or Windows
+        XArmConnectionError
+            If no xArm is found, or if several are found and no serial number
+            is given
 
         Attributes
         ----------
@@ -45,18 +100,14 @@ class Device:
             import easyhid
             self.exception = easyhid.easyhid.HIDException
             en = easyhid.Enumeration()
-            devices = en.find(vid=1155, pid=22352, serial=serial_number)
+            devices = en.find(vid=XARM_VENDOR_ID, pid=XARM_PRODUCT_ID, serial=serial_number)
             if len(devices) == 0:
-                print('\n[ERROR] No device found. Ensure that the xarm is connected via '
-                      'usb cable and the power is on.\n'
-                      'Turn the xarm off and back on again if needed.\n')
-                exit()
+                raise XArmConnectionError(NO_DEVICE_MESSAGE)
             elif len(devices) > 1:
-                serial_numbers = ', '.join([f"\t{d.serial_number}" for d in devices])
-                print('\n[ERROR] More than 1 xarm device found with the following serial numbers: \n'
-                      f'    {serial_numbers}\n'
-                      '  You must specify the serial number in this case.\n')
-                exit()
+                serial_numbers = ', '.join([f"{d.serial_number}" for d in devices])
+                raise XArmConnectionError('More than 1 xarm device found with the following'
+                                          f' serial numbers: {serial_numbers}. You must'
+                                          ' specify the serial number in this case.')
             else:
                 self.device = devices[0]
                 self.serial_number = self.device.serial_number
@@ -69,12 +120,10 @@ class Device:
                 serial_number = str(serial_number)
 
             try:
-                self.device = hid.Device(vid=1155, pid=22352, serial=serial_number)
+                self.device = hid.Device(vid=XARM_VENDOR_ID, pid=XARM_PRODUCT_ID,
+                                         serial=serial_number)
             except hid.HIDException:
-                print('\n[ERROR] No device found. Ensure that the xarm is connected via '
-                      'usb cable and the power is on.\n'
-                      'Turn the xarm off and back on again if needed.\n')
-                exit()
+                raise XArmConnectionError(NO_DEVICE_MESSAGE)
 
             self.serial_number = self.device.serial
             self.type = 1
@@ -86,12 +135,9 @@ class Device:
                     # serial number should be unicode
                     serial_number = str(serial_number)
 
-                self.device.open(1155, 22352, serial_number)
+                self.device.open(XARM_VENDOR_ID, XARM_PRODUCT_ID, serial_number)
             except OSError:
-                print('\n[ERROR] No device found. Ensure that the xarm is connected via '
-                      'usb cable and the power is on.\n'
-                      'Turn the xarm off and back on again if needed.\n')
-                exit()
+                raise XArmConnectionError(NO_DEVICE_MESSAGE)
 
             self.serial_number = self.device.get_serial_number_string()
             self.type = 0
@@ -145,10 +191,26 @@ class XArmController(BaseController):
     SERVO_LOWER_LIMIT = 0
     SERVO_UPPER_LIMIT = 1000
     SERVO_HOME = 500
+    STATE_SOURCE = 'xarm'
 
     POS2RADIANS = np.pi / 180. * ( 240. / 1000. )
 
-    def __init__(self, serial_number=None):
+    # servo offsets applied by this process, keyed by serial number. offsets
+    # persist in the servos until they are power cycled
+    _applied_offsets = {}
+
+    def __init__(self, serial_number=None, device=None):
+        '''Controller for the real xArm, communicating with its servos over usb
+
+        Parameters
+        ----------
+        serial_number : str, optional
+            Serial number of xArm to connect to
+        device : obj, optional
+            Already opened device to communicate through instead of connecting
+            over usb, such as an EmulatedDevice.  It must provide the same
+            interface as Device
+        '''
         super().__init__()
         # speed in radians per second
         self.max_speed = 4.0
@@ -160,6 +222,13 @@ class XArmController(BaseController):
         self.movement_precision = 0.04
         self.measurement_precision = 0.01
         self.measurement_frequency = 10
+        self.dense_monitor_period = 0.02
+        # servos, especially the gripper, take some time to start moving
+        self.motion_latency = 0.1
+
+        # deadline (ms) for each reply, and number of retries if it is missed
+        self.reply_timeout = 50
+        self.max_retries = 2
 
         self.arm_joint_limits = np.array(((-2, -1.58, -2, -1.8, -2),
                                           ( 2,  1.58,  2,  2.0,  2)))
@@ -168,19 +237,74 @@ class XArmController(BaseController):
 
         self.servo_ids = self.arm_joint_ids + self.gripper_joint_ids
         self.n_servos = len(self.servo_ids)
-        self._lock = threading.Lock()
-        self.device, self.serial_number = self.connect(serial_number)
+
+        # predicts positions between reads, see read_jpos(estimate=True)
+        self._estimator = JointStateEstimator(max(self.servo_ids)+1)
+        self.estimate_tolerance = 0.02
+
+        # telemetry is opt-in, see start_telemetry
+        self.telemetry_max_age = None
+        self._telemetry = None
+        self._telemetry_thread = None
+        self._telemetry_stop = threading.Event()
+
+        # voltage is only polled while telemetry is running, but missing
+        # replies are always counted
+        self.health = HealthMonitor()
+
+        # latency histograms are opt-in, see get_latency_stats
+        self.latency = LatencyRecorder()
+
+        self.device, self.serial_number = self.connect(serial_number, device)
+        self.is_connected = True
+        # a device may provide its own clock, e.g. ReplayDevice replays a
+        # recording faster than realtime by not sleeping
+        self._clock = getattr(self.device, 'clock', time.monotonic)
+        self._sleep = getattr(self.device, 'sleep', time.sleep)
+        self.scheduler = TransactionScheduler(self.device, latency=self.latency)
+        self._codec = PacketCodec()
 
         if self.load_configs():
             self.power_on_servos()
+            self.sync_servo_offsets()
 
-            # write servo offsets, these get reset during power cycles
-            for j_id in self.arm_joint_ids:
-                new_offset = self.servo_offsets[j_id]
-                old_offset = self._read_servo_offset(j_id)
-                pos = self._to_pos_units(j_id, self.read_jpos([j_id])[0])
-                self.move_servos([j_id], [self._to_radians(j_id, pos-new_offset+old_offset)])
-                self._write_servo_offset(j_id, new_offset)
+    def sync_servo_offsets(self, force=False):
+        '''Write servo offsets from the config file to the arm servos.  Offsets
+        get reset during power cycles, so all offsets are read in one pass and
+        only the servos whose offset differs are rewritten
+
+        Parameters
+        ----------
+        force : bool, default=False
+            if False, reading the offsets is skipped when this process has
+            already applied the same offsets to this xArm.  Use True if the
+            xArm may have been power cycled since then
+
+        Returns
+        -------
+        list of int
+            ids of joints whose offsets were rewritten
+        '''
+        new_offsets = {j_id : self.servo_offsets[j_id] for j_id in self.arm_joint_ids}
+        if not force and self._applied_offsets.get(self.serial_number) == new_offsets:
+            return []
+
+        old_offsets = dict(zip(self.arm_joint_ids,
+                               self._read_servo_offsets(self.arm_joint_ids)))
+        joint_ids = [j_id for j_id in self.arm_joint_ids
+                        if old_offsets[j_id] != new_offsets[j_id]]
+        if len(joint_ids) > 0:
+            # servos hold their position relative to the offset, so compensate
+            # beforehand so the joints stay where they are
+            pos = self._read_servo_positions(joint_ids)
+            self._move_servo_units(joint_ids,
+                                   [p - new_offsets[j_id] + old_offsets[j_id]
+                                        for j_id, p in zip(joint_ids, pos)],
+                                   1000)
+            [self._write_servo_offset(j_id, new_offsets[j_id]) for j_id in joint_ids]
+
+        self._applied_offsets[self.serial_number] = new_offsets
+        return joint_ids
 
     def load_configs(self):
         if os.path.exists(XARM_CONFIG_FILE):
@@ -190,6 +314,7 @@ class XArmController(BaseController):
                 self.arm_joint_directions = data['arm_joint_directions']
                 self.gripper_joint_limits = data['gripper_joint_limits']
                 self.servo_offsets = data['servo_offsets']
+                self._update_unit_converter()
                 return True
             except KeyError:
                 pass
@@ -201,13 +326,29 @@ class XArmController(BaseController):
         self.arm_joint_directions = {i:1. for i in self.arm_joint_ids}
         self.gripper_joint_limits = np.array(((0.9,),(-1.,)))
         self.servo_offsets = {i:0 for i in self.servo_ids}
+        self._update_unit_converter()
         return False
 
-    def timestep(self):
-        time.sleep(1/self.measurement_frequency)
+    def _update_unit_converter(self):
+        '''Precompute arrays used to convert joint vectors between radians and
+        positional units, must be called when arm_joint_directions changes
+        '''
+        self._units = JointUnitConverter(self.servo_ids,
+                                         self.arm_joint_directions,
+                                         self.SERVO_HOME,
+                                         self.POS2RADIANS)
+
+    def timestep(self, dt=None):
+        self._sleep(1/self.measurement_frequency if dt is None else dt)
 
-    def connect(self, serial_number=None):
-        device = Device(serial_number)
+    def clock(self):
+        '''Current time (s), from the device if it provides a clock
+        '''
+        return self._clock()
+
+    def connect(self, serial_number=None, device=None):
+        if device is None:
+            device = Device(serial_number)
         serial_number = device.serial_number
         print(f'Connected to xArm (serial={serial_number})')
         return device, serial_number
@@ -215,9 +356,160 @@ class XArmController(BaseController):
     def disconnect(self):
         '''Closes HID connection to xArm
         '''
+        if not self.is_connected:
+            return
+        self.is_connected = False
+        self.stop_telemetry()
+        self.scheduler.close()
         self.device.close()
         print('Disconnected xArm')
 
+    def start_telemetry(self, rate=50, max_age=None, health_rate=1):
+        '''Start background thread that polls the positions of all servos and
+        publishes them as a timestamped snapshot.  While running, read_jpos
+        answers from the snapshot if it is recent enough instead of
+        communicating with the xArm.  Supply voltage and communication
+        counters are fed to the health monitor at a lower rate
+
+        Parameters
+        ----------
+        rate : float, default=50
+            polling frequency in Hz
+        max_age : float, optional
+            default maximum age (s) of the snapshot for read_jpos to use it. if
+            not provided, two polling periods are used
+        health_rate : float, default=1
+            frequency in Hz at which health is polled, it cannot exceed rate.
+            if None, health is not polled
+        '''
+        self.stop_telemetry()
+
+        health_every = None
+        if health_rate is not None:
+            health_every = max(1, int(round(rate / health_rate)))
+
+        self.telemetry_max_age = 2. / rate if max_age is None else max_age
+        self._telemetry_stop = threading.Event()
+        self._telemetry_thread = threading.Thread(target=_poll_telemetry,
+                                                  args=(weakref.ref(self),
+                                                        1. / rate,
+                                                        self._telemetry_stop,
+                                                        health_every),
+                                                  daemon=True)
+        self._telemetry_thread.start()
+
+    def stop_telemetry(self):
+        '''Stop background telemetry thread, subsequent reads will communicate
+        with the xArm directly
+        '''
+        self._telemetry_stop.set()
+        if self._telemetry_thread is not None \
+                and self._telemetry_thread is not threading.current_thread():
+            self._telemetry_thread.join()
+        self._telemetry_thread = None
+        self._telemetry = None
+        self.telemetry_max_age = None
+
+    def get_telemetry(self):
+        '''Get latest telemetry snapshot
+
+        Returns
+        -------
+        float
+            time.monotonic() timestamp at which positions were requested
+        dict
+            joint positions in radians keyed by joint id
+        '''
+        if self._telemetry is None:
+            return None, {}
+        timestamp, pos = self._telemetry
+        return timestamp, {j_id : self._to_radians(j_id, pos[j_id])
+                           for j_id in self.servo_ids}
+
+    def _update_telemetry(self):
+        '''Read all servo positions and publish them as latest snapshot
+        '''
+        timestamp = time.monotonic()
+        try:
+            pos = self._read_servo_positions(self.servo_ids, priority=Priority.LOW)
+        except XArmError:
+            # keep previous snapshot, it will be ignored by readers once stale
+            return
+
+        # index by servo id for cheap lookups
+        pos_by_id = np.zeros(max(self.servo_ids)+1, dtype=int)
+        pos_by_id[self.servo_ids] = pos
+        self._telemetry = (timestamp, pos_by_id)
+
+    def _update_health(self):
+        '''Read supply voltage and feed it to the health monitor, along with
+        the communication counters
+        '''
+        try:
+            self.health.record_voltage(self.read_voltage(priority=Priority.LOW))
+        except XArmError:
+            # failure is counted in io stats
+            pass
+        self.health.record_io_stats(self.scheduler.stats)
+
+    def read_voltage(self, priority=Priority.NORMAL):
+        '''Read supply voltage of the xArm control board.  It drops when the
+        servos are under load, and brown-outs make moves slow or fail
+
+        Returns
+        -------
+        float
+            voltage in volts
+        '''
+        ret = self.scheduler.transact(self._codec.encode(CmdLib.BATTERY_VOLTAGE, []),
+                                      reply_cmd=CmdLib.BATTERY_VOLTAGE,
+                                      timeout=self.reply_timeout,
+                                      priority=priority,
+                                      retries=self.max_retries)
+        return self._codec.decode_voltage(ret)
+
+    def get_health(self):
+        '''Get health of the xArm, see HealthMonitor.snapshot.  Use
+        controller.health.add_callback to be notified of brown-outs, e.g.
+
+            controller.health.add_callback('voltage', 6.5, fn, below=True)
+
+        Returns
+        -------
+        dict
+            rolling statistics of supply voltage (V), which are only updated
+            while telemetry is running, counts of missing replies keyed by
+            servo id, and counters of communication
+        '''
+        self.health.record_io_stats(self.scheduler.stats)
+        return self.health.snapshot()
+
+    def get_io_stats(self):
+        '''Get counters of communication with the xArm
+
+        Returns
+        -------
+        dict
+            number of transactions, retries, timeouts, errors and failures.
+            a failure is a transaction that did not succeed after all retries
+        '''
+        return dict(self.scheduler.stats)
+
+    def get_latency_stats(self):
+        '''Get latency histograms of communication with the xArm.  Recording
+        must first be enabled with `controller.latency.enabled = True`
+
+        Returns
+        -------
+        dict
+            summary of latencies (s) keyed by name: 'read_jpos' and
+            'move_servos' are measured on the calling thread, 'queue_wait' is
+            the time a transaction waits for the I/O thread, and the remaining
+            entries are the time spent communicating with the device for each
+            command.  see LatencyHistogram.snapshot
+        '''
+        return self.latency.snapshot()
+
     def power_on_servos(self):
         '''Turn on all servos so all joints are rigid
         '''
@@ -246,7 +538,22 @@ class XArmController(BaseController):
         ----------
         joint_id : int
         '''
-        self._send(CmdLib.POWER_OFF, [1, joint_id])
+        self._send(CmdLib.POWER_OFF, [1, joint_id], priority=Priority.HIGH)
+        self._estimator.power_off([joint_id])
+
+    def stop_servos(self, joint_ids=None):
+        '''Stop servos at their current positions.  Commands are issued in the
+        high priority lane, so they are served before queued reads and moves
+
+        Parameters
+        ----------
+        joint_ids : array_like of int, optional
+            joints to stop, defaults to all servos
+        '''
+        if joint_ids is None:
+            joint_ids = self.servo_ids
+        pos = self._read_servo_positions(joint_ids, priority=Priority.HIGH)
+        self._move_servo_units(joint_ids, pos, 0, priority=Priority.HIGH)
 
     def get_joint_id(self, joint_name):
         '''Get joint id associated with a given joint name, joint id may be used
@@ -290,7 +597,7 @@ class XArmController(BaseController):
                 1 : 'gripper'
                }[joint_id]
 
-    def write_jpos(self, joint_ids, jpos, speed=None):
+    def write_jpos(self, joint_ids, jpos, speed=None, sync=True):
         '''Issue move command to specified joint indices
 
         Parameters
@@ -300,123 +607,351 @@ class XArmController(BaseController):
         jpos : array_like of float
             target joint positions corresponding to the joint indices
         speed : float or array_like of float, default=None
+        sync : bool, default=True
+            if True, all joints share the duration of the slowest joint so they
+            start and finish together, and a single move packet is sent. if
+            False, each joint moves at its own speed; joints that share a
+            duration are still grouped into one packet
 
         Returns
         -------
         float
             expected time (s) to complete movement
         '''
+        current_jpos = self.read_jpos(joint_ids)
+        duration_ms = self._move_durations(jpos, current_jpos, speed)
+
+        if sync:
+            self.move_servos(joint_ids, jpos, int(np.max(duration_ms)))
+        else:
+            for dur in np.unique(duration_ms):
+                group = np.flatnonzero(duration_ms == dur)
+                self.move_servos([joint_ids[i] for i in group],
+                                 [jpos[i] for i in group],
+                                 int(dur))
+
+        return np.max(duration_ms)/1000.
+
+    async def async_write_jpos(self, joint_ids, jpos, speed=None):
+        '''Awaitable version of write_jpos with sync=True, the event loop is
+        not blocked while communicating with the xArm
+        '''
+        current_jpos = await self.async_read_jpos(joint_ids)
+        duration_ms = self._move_durations(jpos, current_jpos, speed)
+
+        pos = self._units.to_pos_units(joint_ids, jpos)
+        pos = np.clip(pos, self.SERVO_LOWER_LIMIT, self.SERVO_UPPER_LIMIT)
+        # copy since codec buffer is shared by all tasks on this thread
+        msg = bytes(self._codec.encode_move(joint_ids, pos, int(np.max(duration_ms))))
+        transaction = self.scheduler.submit(msg)
+        self._estimator.update_command(joint_ids, pos, np.max(duration_ms)/1000.,
+                                       time.monotonic())
+        await transaction.wait_async()
+
+        return np.max(duration_ms)/1000.
+
+    def _move_durations(self, jpos, current_jpos, speed):
+        '''Duration (ms) of move of each joint at the given speed, which is
+        clipped to the allowed range
+        '''
         if speed is None:
             speed = self.default_speed
         if np.isscalar(speed):
-            speed = np.full(len(joint_ids), speed)
+            speed = np.full(len(jpos), speed)
 
         speed = np.clip(speed, self.min_speed, self.max_speed)
 
-        current_jpos = self.read_jpos(joint_ids)
         delta_jpos = np.abs(np.subtract(jpos, current_jpos))
-        duration_ms = (1000 * delta_jpos / speed).astype(int)
+        return (1000 * delta_jpos / speed).astype(int)
 
-        [self.move_servos([j_i], [j_p], dur)
-             for j_i, j_p, dur in zip(joint_ids, jpos, duration_ms)]
+    def execute_trajectory(self, joint_ids, timestamps, jpos):
+        '''Stream move commands to follow time-parameterized joint trajectory
 
-        return np.max(duration_ms)/1000.
+        The move towards each waypoint is commanded when the previous waypoint
+        is due, with a duration that ends when the waypoint is due.  Deadlines
+        are measured from the start of execution with a monotonic clock so
+        that lateness in one command does not accumulate
+
+        Parameters
+        ----------
+        joint_ids : array_like of int
+            joint indices
+        timestamps : array_like of float
+            time (s) at which each waypoint should be reached, relative to the
+            first waypoint; shape=(N,)
+        jpos : array_like of float
+            joint positions of each waypoint in radians; shape=(N, len(joint_ids))
+
+        Raises
+        ------
+        ValueError
+            If timestamps are not increasing or if trajectory exceeds max_speed
 
-    def read_jpos(self, j_idxs):
+        Returns
+        -------
+        ndarray
+            lateness (s) with which move towards each waypoint was commanded;
+            shape=(N-1,)
+        ndarray
+            achieved joint positions after the last waypoint
+        '''
+        timestamps = np.asarray(timestamps, dtype=float) - timestamps[0]
+        jpos = np.asarray(jpos, dtype=float)
+
+        intervals = np.diff(timestamps)
+        if (intervals <= 0).any():
+            raise ValueError('Trajectory timestamps must be strictly increasing')
+        speeds = np.abs(np.diff(jpos, axis=0)) / intervals[:,None]
+        if speeds.max(initial=0) > self.max_speed:
+            raise ValueError(f'Trajectory exceeds max speed of {self.max_speed} rad/s')
+
+        lateness = np.zeros(len(intervals))
+        start_time = self.clock()
+        for i in range(len(intervals)):
+            delay = start_time + timestamps[i] - self.clock()
+            if delay > 0:
+                self._sleep(delay)
+
+            # keep arrival on schedule even if this command is late
+            elapsed = self.clock() - start_time
+            lateness[i] = elapsed - timestamps[i]
+            duration_ms = max(int(1000 * (timestamps[i+1] - elapsed)), 0)
+            self.move_servos(joint_ids, jpos[i+1], duration_ms)
+
+        delay = start_time + timestamps[-1] - self.clock()
+        if delay > 0:
+            self._sleep(delay)
+
+        return lateness, np.array(self.read_jpos(joint_ids))
+
+    @timed('read_jpos')
+    def read_jpos(self, j_idxs, max_age=None, estimate=False, tolerance=None):
         '''Read some joint positions
 
         Parameters
         ----------
         j_idxs : array_like of int
             joint indices whose position should be read
+        max_age : float, optional
+            maximum age (s) of telemetry snapshot that can be used instead of
+            reading from the xArm.  Defaults to telemetry_max_age, which is
+            only set while telemetry is running
+        estimate : bool, default=False
+            if True, positions predicted from the last commands and reads are
+            returned when their uncertainty is within tolerance, so that most
+            reads can be avoided.  see estimate_jpos
+        tolerance : float, optional
+            largest uncertainty (radians) of an estimate that may be returned,
+            defaults to estimate_tolerance
 
         Returns
         -------
         jpos : list of float
             joint positions in radians, will be same length as j_idxs
         '''
-        self._send(CmdLib.POSITION_READ,
-                   [len(j_idxs), *j_idxs])
-        pos = self._recv(CmdLib.POSITION_READ, ret_type='short')
+        if estimate:
+            if tolerance is None:
+                tolerance = self.estimate_tolerance
+            pos, uncertainty = self._estimator.predict(j_idxs, time.monotonic())
+            if np.all(uncertainty * self.POS2RADIANS <= tolerance):
+                return self._positions_to_jpos(j_idxs, pos)
+
+        _, pos = self._telemetry_positions(j_idxs, max_age)
+        if pos is None:
+            pos = self._read_servo_positions(j_idxs)
+
+        return self._positions_to_jpos(j_idxs, pos)
+
+    def estimate_jpos(self, j_idxs):
+        '''Predict joint positions without communicating with the xArm.  The
+        servos move linearly to their target over the commanded duration, so
+        the commanded motion since the last read is applied to that read
+
+        Parameters
+        ----------
+        j_idxs : array_like of int
+            joint indices whose position should be estimated
+
+        Returns
+        -------
+        jpos : list of float
+            estimated joint positions in radians, nan if joint was never read
+        uncertainty : list of float
+            bound on error of each estimate in radians, inf if joint was never
+            read
+        '''
+        pos, uncertainty = self._estimator.predict(j_idxs, time.monotonic())
+        jpos = self._units.to_radians(j_idxs, pos)
+        return jpos.tolist(), (uncertainty * self.POS2RADIANS).tolist()
 
-        if len(pos) != len(j_idxs):
-            print('\n[ERROR]: Unable to connect to all motors.'
-                  ' Check that all wires between motors are connected properly.\n')
-            del self
-            exit()
+    async def async_read_jpos(self, j_idxs, max_age=None):
+        '''Awaitable version of read_jpos, the event loop is not blocked while
+        waiting for the reply from the xArm
+        '''
+        _, pos = self._telemetry_positions(j_idxs, max_age)
+        if pos is None:
+            # copy since codec buffer is shared by all tasks on this thread
+            msg = bytes(self._codec.encode_position_read(j_idxs))
+            timestamp = time.monotonic()
+            transaction = self.scheduler.submit(msg,
+                                                reply_cmd=CmdLib.POSITION_READ,
+                                                timeout=self.reply_timeout,
+                                                retries=self.max_retries)
+            ret = await transaction.wait_async()
+            pos = self._decode_servo_positions(ret, j_idxs)
+            self._estimator.update_measurement(j_idxs, pos, timestamp)
+
+        return self._positions_to_jpos(j_idxs, pos)
+
+    def _telemetry_positions(self, j_idxs, max_age):
+        '''Positions (positional units) from telemetry snapshot, along with the
+        timestamp of the snapshot.  Both are None if there is no snapshot
+        younger than max_age
+        '''
+        if max_age is None:
+            max_age = self.telemetry_max_age
 
+        telemetry = self._telemetry
+        if max_age is not None and telemetry is not None \
+                and time.monotonic() - telemetry[0] <= max_age:
+            return telemetry[0], telemetry[1][list(j_idxs)]
+        return None, None
+
+    def read_arm_state(self, max_age=None, estimate=False, tolerance=None):
+        '''Read arm joint positions and gripper state with a single read of all
+        servos, or from the telemetry snapshot if it is recent enough
+
+        Parameters
+        ----------
+        max_age : float, optional
+            maximum age (s) of telemetry snapshot, see read_jpos
+        estimate : bool, default=False
+            if True, predicted positions are used when their uncertainty is
+            within tolerance, see read_jpos
+        tolerance : float, optional
+            largest uncertainty (radians) of an estimate that may be used,
+            defaults to estimate_tolerance
+
+        Returns
+        -------
+        ArmState
+        '''
+        if estimate:
+            if tolerance is None:
+                tolerance = self.estimate_tolerance
+            timestamp = time.monotonic()
+            pos, uncertainty = self._estimator.predict(self.servo_ids, timestamp)
+            if np.all(uncertainty * self.POS2RADIANS <= tolerance):
+                jpos = self._positions_to_jpos(self.servo_ids, pos)
+                return self._make_arm_state(timestamp, jpos, 'estimate')
+
+        timestamp, pos = self._telemetry_positions(self.servo_ids, max_age)
+        source = 'telemetry'
+        if pos is None:
+            timestamp = time.monotonic()
+            pos = self._read_servo_positions(self.servo_ids)
+            source = self.STATE_SOURCE
+
+        jpos = self._positions_to_jpos(self.servo_ids, pos)
+        return self._make_arm_state(timestamp, jpos, source)
+
+    def _positions_to_jpos(self, j_idxs, pos):
         pos = np.clip(pos, self.SERVO_LOWER_LIMIT, self.SERVO_UPPER_LIMIT)
 
-        jpos = [self._to_radians(i, p) for i,p in zip(j_idxs, pos)]
-        return jpos
+        jpos = self._units.to_radians(j_idxs, pos)
+        return jpos.tolist()
 
-    def move_servos(self, joint_ids, jpos, duration=1000):
+    def _read_servo_positions(self, servo_ids, priority=Priority.NORMAL):
+        # returns in positional units
+        timestamp = time.monotonic()
+        ret = self.scheduler.transact(self._codec.encode_position_read(servo_ids),
+                                      reply_cmd=CmdLib.POSITION_READ,
+                                      timeout=self.reply_timeout,
+                                      priority=priority,
+                                      retries=self.max_retries)
+        pos = self._decode_servo_positions(ret, servo_ids)
+        self._estimator.update_measurement(servo_ids, pos, timestamp)
+        return pos
+
+    def _decode_servo_positions(self, ret, servo_ids):
+        pos = self._codec.decode(ret, 'short')
+        if len(pos) != len(servo_ids):
+            replied = self._codec.decode_servo_ids(ret, 'short')
+            missing = [s_id for s_id in servo_ids if s_id not in replied]
+            self.health.record_missing_replies(missing)
+            raise XArmServoError('Unable to connect to all motors. Check that all'
+                                 ' wires between motors are connected properly.'
+                                 f' Missing servos: {missing}', missing)
+        return pos
+
+    @timed('move_servos')
+    def move_servos(self, joint_ids, jpos, duration=1000, priority=Priority.NORMAL,
+                    wait=True):
         # convert to positional units
-        pos = [self._to_pos_units(j_id, jp) for j_id, jp in zip(joint_ids, jpos)]
+        pos = self._units.to_pos_units(joint_ids, jpos)
+        return self._move_servo_units(joint_ids, pos, duration, priority, wait)
 
+    def _move_servo_units(self, joint_ids, pos, duration, priority=Priority.NORMAL,
+                          wait=True):
         # ensure pos is within servo limits to prevent servo damage
         pos = np.clip(pos, self.SERVO_LOWER_LIMIT, self.SERVO_UPPER_LIMIT)
 
-        data = [len(joint_ids), *itos(duration)]
-        for j_id, p in zip(joint_ids, pos):
-            data.extend([j_id, *itos(p)])
-
-        self._send(CmdLib.MOVE, data)
+        msg = self._codec.encode_move(joint_ids, pos, duration)
+        transaction = self.scheduler.submit(msg, priority=priority)
+        self._estimator.update_command(joint_ids, pos, duration/1000., time.monotonic())
+        if wait:
+            transaction.wait()
+        else:
+            # message lives in the codec buffer of this thread, so caller must
+            # wait for it before issuing another command from this thread
+            return transaction
 
     def _read_servo_offset(self, servo_id):
         # returns in positional units
-        self._send(CmdLib.OFFSET_READ, [1, servo_id])
-        pos = self._recv(CmdLib.OFFSET_READ, ret_type='char')[0]
+        pos = self._request(CmdLib.OFFSET_READ, [1, servo_id], ret_type='char')[0]
         return pos
 
+    def _read_servo_offsets(self, servo_ids):
+        # returns in positional units, reads all offsets in one transaction
+        try:
+            offsets = self._request(CmdLib.OFFSET_READ,
+                                    [len(servo_ids), *servo_ids],
+                                    ret_type='char')
+        except XArmTimeoutError:
+            offsets = []
+        if len(offsets) != len(servo_ids):
+            # fall back to reading servos one at a time
+            offsets = [self._read_servo_offset(s_id) for s_id in servo_ids]
+        return offsets
+
     def _write_servo_offset(self, servo_id, offset):
         # operates in in positional units
         offset = int(np.clip(offset, -127, 127))
         if offset < 0:
             offset = 255 + offset
         self._send(CmdLib.OFFSET_WRITE, [servo_id, offset])
+        # reported position changes with offset
+        self._estimator.reset([servo_id])
 
-    def _send(self, cmd, data=[]):
-        msg = [
-            0, # this will be deleted for easyhid
-            CmdLib.SIGNATURE,
-            CmdLib.SIGNATURE,
-            len(data)+2,
-            cmd,
-            *data
-        ]
-        with self._lock:
-            self.device.write(msg)
-
-    def _recv(self, cmd, ret_type, timeout=1000):
+    def _send(self, cmd, data=[], priority=Priority.NORMAL):
+        '''Send command that has no reply, returns once it has been written
         '''
+        self.scheduler.transact(self._codec.encode(cmd, data), priority=priority)
+
+    def _request(self, cmd, data, ret_type, priority=Priority.NORMAL):
+        '''Send command and read its reply within a single transaction, so
+        replies cannot be read by another thread.  Raises XArmTimeoutError if
+        there is no reply after retrying
+
         short : -32,768 to 32,767 for positional readings
         char : -128 to 127 for servo offsets
         '''
-        with self._lock:
-            ret = self.device.read(timeout)
-        if ret is None:
-            # timed out
-            return ret
-        count = ret[4]
-
-        assert ret[3] == cmd
-
-        recv_data = []
-        packet_size = 3 if ret_type == 'short' else 2
-        for i in range(count):
-            lsb = ret[5 + packet_size*i + 1]
-            msb = ret[5 + packet_size*i + 2]
-            if ret_type == 'short':
-                data = (msb << 8) + lsb
-                if data > 32767:
-                    data = data - 65_535
-            elif ret_type == 'char':
-                data = lsb if lsb < 128 else lsb-255
-            else:
-                raise TypeError
-            recv_data.append(data)
-        return recv_data
+        ret = self.scheduler.transact(self._codec.encode(cmd, data),
+                                      reply_cmd=cmd,
+                                      timeout=self.reply_timeout,
+                                      priority=priority,
+                                      retries=self.max_retries)
+        return self._codec.decode(ret, ret_type)
 
     def _to_radians(self, joint_id, pos):
         '''Convert servo positional unit to angle in radians.  This will
@@ -482,17 +1017,28 @@ class XArmController(BaseController):
                 self._write_servo_offset(j_id, new_offset)
 
             offsets[j_id] = new_offset
+
+        if success:
+            self._applied_offsets[self.serial_number] = offsets
+        else:
+            self._applied_offsets.pop(self.serial_number, None)
         return success, offsets
 
     def __del__(self):
         '''Makes sure servos are off before disconnecting
         '''
+        if not getattr(self, 'is_connected', False):
+            # already disconnected, or device was never created
+            return
         try:
             self.power_off_servos()
             self.disconnect()
         except AttributeError:
             # device was never created so no need to disconnect
             pass
+        except XArmError:
+            # connection was lost, servos cannot be turned off
+            self.disconnect()
 
 if __name__ == "__main__":
     xarm = XArmController()
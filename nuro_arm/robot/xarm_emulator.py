@@ -0,0 +1,235 @@
+import time
+import random
+import threading
+from collections import deque
+
+import numpy as np
+
+from nuro_arm.robot.xarm_codec import CmdLib, itos
+
+class EmulatedServo:
+    # in servo positional units
+    LOWER_LIMIT = 0
+    UPPER_LIMIT = 1000
+    HOME = 500
+
+    def __init__(self, servo_id, pos=HOME):
+        '''Bus servo that linearly interpolates to its target over the
+        commanded duration, like the servos in the xArm
+
+        Positions are tracked in physical units; the servo reports its
+        position relative to its offset.
+
+        Parameters
+        ----------
+        servo_id : int
+        pos : int, default to 500
+            initial reported position in positional units
+        '''
+        self.servo_id = servo_id
+        self.offset = 0
+        self.powered = False
+        self._start_pos = float(pos)
+        self._target_pos = float(pos)
+        self._start_time = 0.
+        self._duration = 0.
+
+    def position(self, t):
+        '''Reported position at time t, in positional units
+        '''
+        return self._physical_position(t) - self.offset
+
+    def is_moving(self, t):
+        return t < self._start_time + self._duration
+
+    def move(self, target, duration, t):
+        '''Start moving towards target (positional units) over duration (s)
+        '''
+        target = np.clip(target, self.LOWER_LIMIT, self.UPPER_LIMIT)
+        self._start_pos = self._physical_position(t)
+        self._target_pos = target + self.offset
+        self._start_time = t
+        self._duration = max(duration, 0.)
+        self.powered = True
+
+    def power_off(self, t):
+        '''Stop servo where it is, it no longer holds a position
+        '''
+        self._start_pos = self._target_pos = self._physical_position(t)
+        self._duration = 0.
+        self.powered = False
+
+    def set_position(self, pos, t):
+        '''Set reported position directly, as if moved by hand while passive
+        '''
+        self._start_pos = self._target_pos = pos + self.offset
+        self._start_time = t
+        self._duration = 0.
+
+    def set_offset(self, offset, t):
+        '''Change offset.  A powered servo holds its reported position, so the
+        physical joint jumps by the change in offset
+        '''
+        if self.powered:
+            delta = offset - self.offset
+            self._start_pos = self._physical_position(t) + delta
+            self._target_pos += delta
+            self._start_time = t
+            self._duration = max(self._start_time + self._duration - t, 0.)
+        self.offset = offset
+
+    def _physical_position(self, t):
+        if t >= self._start_time + self._duration:
+            return self._target_pos
+        frac = (t - self._start_time) / self._duration
+        return self._start_pos + frac * (self._target_pos - self._start_pos)
+
+
+class EmulatedDevice:
+    REPORT_SIZE = 64
+
+    def __init__(self,
+                 serial_number='emulated',
+                 servo_ids=(1, 2, 3, 4, 5, 6),
+                 latency=0.0005,
+                 jitter=0.0002,
+                 drop_rate=0.,
+                 seed=None,
+                 voltage=7.5,
+                 voltage_sag=0.15,
+                ):
+        '''Software emulation of the xArm servo bus, with the same interface
+        as Device.  Can be passed to XArmController (or RobotArm) to run the
+        real arm code path without any hardware attached
+
+        Parameters
+        ----------
+        serial_number : str, default to 'emulated'
+            serial number reported by the device
+        servo_ids : tuple of int, default to (1, 2, 3, 4, 5, 6)
+            ids of servos that are connected to the bus, other servos will not
+            respond to position or offset reads
+        latency : float, default to 0.0005
+            time (s) added to every transaction with the device
+        jitter : float, default to 0.0002
+            maximum random time (s) added on top of latency
+        drop_rate : float, default to 0
+            probability that a reply is lost, used to emulate usb glitches
+        seed : int, optional
+            seed for random number generator used for jitter
+        voltage : float, default to 7.5
+            supply voltage (V) reported while no servos are moving
+        voltage_sag : float, default to 0.15
+            drop in supply voltage (V) for every servo that is moving
+
+        Attributes
+        ----------
+        servos : dict
+            EmulatedServo objects keyed by servo id
+        type : int
+            matches Device.type, so messages include leading 0
+        '''
+        self.serial_number = serial_number
+        self.type = 0
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.voltage = voltage
+        self.voltage_sag = voltage_sag
+        self.servos = {s_id : EmulatedServo(s_id) for s_id in servo_ids}
+
+        self._rng = random.Random(seed)
+        self._responses = deque()
+        self._lock = threading.Lock()
+        self.is_open = True
+
+    def write(self, msg):
+        '''Write message to device
+
+        Parameters
+        ----------
+        msg : array_like
+            message of the form [0, SIGNATURE, SIGNATURE, length, cmd, *data]
+        '''
+        self._delay()
+        msg = list(msg[1:])
+        if msg[0] != CmdLib.SIGNATURE or msg[1] != CmdLib.SIGNATURE:
+            return
+        cmd = msg[3]
+        data = msg[4:msg[2]+2]
+        t = time.monotonic()
+
+        with self._lock:
+            if cmd == CmdLib.MOVE:
+                count = data[0]
+                duration = (data[1] + (data[2] << 8)) / 1000.
+                for i in range(count):
+                    s_id, lsb, msb = data[3+3*i:6+3*i]
+                    if s_id in self.servos:
+                        self.servos[s_id].move(lsb + (msb << 8), duration, t)
+            elif cmd == CmdLib.POWER_OFF:
+                for s_id in data[1:1+data[0]]:
+                    if s_id in self.servos:
+                        self.servos[s_id].power_off(t)
+            elif cmd == CmdLib.POSITION_READ:
+                response = [CmdLib.POSITION_READ, 0]
+                for s_id in data[1:1+data[0]]:
+                    if s_id in self.servos:
+                        pos = int(round(self.servos[s_id].position(t)))
+                        response.extend([s_id, *itos(pos & 0xFFFF)])
+                        response[1] += 1
+                self._respond(response)
+            elif cmd == CmdLib.BATTERY_VOLTAGE:
+                n_moving = sum(s.is_moving(t) for s in self.servos.values())
+                voltage = self.voltage - self.voltage_sag * n_moving
+                self._respond([CmdLib.BATTERY_VOLTAGE, *itos(int(1000*voltage))])
+            elif cmd == CmdLib.OFFSET_READ:
+                response = [CmdLib.OFFSET_READ, 0]
+                for s_id in data[1:1+data[0]]:
+                    if s_id in self.servos:
+                        offset = self.servos[s_id].offset
+                        response.extend([s_id, offset if offset >= 0 else 255+offset])
+                        response[1] += 1
+                self._respond(response)
+            elif cmd == CmdLib.OFFSET_WRITE:
+                s_id, offset = data[:2]
+                if s_id in self.servos:
+                    offset = offset if offset < 128 else offset-255
+                    self.servos[s_id].set_offset(offset, t)
+
+    def read(self, timeout):
+        '''Read message from device
+
+        Parameters
+        ----------
+        timeout : int
+            timeout period in milliseconds
+
+        Returns
+        -------
+        bytes
+            message received from device, None if timed out
+        '''
+        self._delay()
+        with self._lock:
+            if len(self._responses):
+                return self._responses.popleft()
+        time.sleep(timeout/1000.)
+        return None
+
+    def close(self):
+        self.is_open = False
+
+    def _respond(self, response):
+        '''Queue a response packet, padded to the report size
+        '''
+        if self._rng.random() < self.drop_rate:
+            return
+        packet = [CmdLib.SIGNATURE, CmdLib.SIGNATURE, len(response)+1, *response]
+        packet.extend([0] * (self.REPORT_SIZE - len(packet)))
+        self._responses.append(bytes(packet))
+
+    def _delay(self):
+        delay = self.latency + self.jitter * self._rng.random()
+        if delay > 0:
+            time.sleep(delay)
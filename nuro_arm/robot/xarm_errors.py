@@ -0,0 +1,21 @@
+class XArmError(Exception):
+    '''Base class for errors communicating with the xArm
+    '''
+    pass
+
+class XArmConnectionError(XArmError):
+    '''xArm could not be found, or the usb connection failed
+    '''
+    pass
+
+class XArmTimeoutError(XArmError):
+    '''xArm did not reply before the deadline, even after retrying
+    '''
+    pass
+
+class XArmServoError(XArmError):
+    '''Some servos did not reply, usually due to loose wires between servos
+    '''
+    def __init__(self, message, servo_ids=()):
+        super().__init__(message)
+        self.servo_ids = list(servo_ids)
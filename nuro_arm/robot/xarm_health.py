@@ -0,0 +1,146 @@
+import threading
+from collections import deque
+
+import numpy as np
+
+class RollingStats:
+    def __init__(self, window=60):
+        '''Statistics over the most recent samples of a signal
+
+        Parameters
+        ----------
+        window : int, default=60
+            number of samples that are kept
+        '''
+        self._samples = deque(maxlen=window)
+
+    def add(self, value):
+        self._samples.append(value)
+
+    def snapshot(self):
+        '''Returns
+        -------
+        dict
+            last, mean, min and max of samples in window, nan if empty
+        '''
+        if len(self._samples) == 0:
+            return dict(last=np.nan, mean=np.nan, min=np.nan, max=np.nan)
+        samples = np.array(self._samples)
+        return dict(last=float(samples[-1]), mean=float(samples.mean()),
+                    min=float(samples.min()), max=float(samples.max()))
+
+class HealthMonitor:
+    # metrics that threshold callbacks can watch
+    METRICS = ('voltage', 'voltage_mean', 'missing_replies', 'timeouts', 'failures')
+
+    def __init__(self, window=60):
+        '''Tracks health of the xArm: supply voltage of the board, servos that
+        did not reply to reads, and failed communication.  Brown-outs under
+        load show up as voltage drops, usually followed by slow or failed moves
+
+        Parameters
+        ----------
+        window : int, default=60
+            number of voltage samples used for rolling statistics
+        '''
+        self.voltage = RollingStats(window)
+        self.missing_replies = {}
+        self.io_stats = {}
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def add_callback(self, metric, threshold, callback, below=False):
+        '''Call callback(metric, value) when a metric crosses a threshold.  The
+        callback fires once per crossing, and is armed again when the metric
+        returns to the other side of the threshold.  Callbacks run on the
+        thread that updates health, usually the telemetry thread, so they
+        should return quickly
+
+        Parameters
+        ----------
+        metric : str, {'voltage', 'voltage_mean', 'missing_replies', 'timeouts', 'failures'}
+            voltage metrics are in volts, the others are total counts
+        threshold : float
+        callback : callable
+        below : bool, default=False
+            if True, fire when metric drops below threshold, otherwise when it
+            rises above it.  use True for voltage metrics
+        '''
+        if metric not in self.METRICS:
+            raise ValueError(f'Unknown metric {metric}, must be one of {self.METRICS}')
+        with self._lock:
+            self._callbacks.append(dict(metric=metric,
+                                        threshold=threshold,
+                                        callback=callback,
+                                        below=below,
+                                        triggered=False))
+
+    def record_voltage(self, voltage):
+        '''Add voltage (V) sample
+        '''
+        with self._lock:
+            self.voltage.add(voltage)
+        self._check_callbacks()
+
+    def record_missing_replies(self, servo_ids):
+        '''Count servos that did not reply to a read
+        '''
+        with self._lock:
+            for s_id in servo_ids:
+                self.missing_replies[s_id] = self.missing_replies.get(s_id, 0) + 1
+        self._check_callbacks()
+
+    def record_io_stats(self, io_stats):
+        '''Update counters of communication, see XArmController.get_io_stats
+        '''
+        with self._lock:
+            self.io_stats = dict(io_stats)
+        self._check_callbacks()
+
+    def metrics(self):
+        '''Current value of each metric that callbacks can watch
+
+        Returns
+        -------
+        dict
+        '''
+        with self._lock:
+            voltage = self.voltage.snapshot()
+            return {
+                'voltage' : voltage['last'],
+                'voltage_mean' : voltage['mean'],
+                'missing_replies' : sum(self.missing_replies.values()),
+                'timeouts' : self.io_stats.get('timeouts', 0),
+                'failures' : self.io_stats.get('failures', 0),
+            }
+
+    def snapshot(self):
+        '''Summary of health
+
+        Returns
+        -------
+        dict
+            rolling voltage statistics (V), missing replies keyed by servo id,
+            and counters of communication
+        '''
+        with self._lock:
+            return dict(voltage=self.voltage.snapshot(),
+                        missing_replies=dict(self.missing_replies),
+                        io_stats=dict(self.io_stats))
+
+    def _check_callbacks(self):
+        metrics = self.metrics()
+        fired = []
+        with self._lock:
+            for cb in self._callbacks:
+                value = metrics[cb['metric']]
+                if np.isnan(value):
+                    continue
+                crossed = value < cb['threshold'] if cb['below'] \
+                        else value > cb['threshold']
+                if crossed and not cb['triggered']:
+                    fired.append((cb['callback'], cb['metric'], value))
+                cb['triggered'] = crossed
+
+        for callback, metric, value in fired:
+            callback(metric, value)
@@ -103,9 +103,9 @@ class GUI(tk.Frame):
         self.is_active = not self.is_active
         if self.is_active:
             self.robot.active_mode()
-            arm_jpos = self.robot.get_arm_jpos()
-            [scl.set(jpos) for scl,jpos in zip(self.scales[:-1], arm_jpos)]
-            self.scales[-1].set(self.robot.get_gripper_state())
+            state = self.robot.get_arm_state()
+            [scl.set(jpos) for scl,jpos in zip(self.scales[:-1], state.arm_jpos)]
+            self.scales[-1].set(state.gripper_state)
 
             self.btn_toggle_mode.config(bg=self.color_active,
                                         activebackground=self.color_active_hl,
@@ -133,11 +133,11 @@ class GUI(tk.Frame):
                 self.robot.set_gripper_state(gripper_state)
                 self.last_gripper_command = gripper_state
         else:
-            # read positions and update scales
-            gripper_state = self.robot.get_gripper_state()
-            arm_jpos = self.robot.get_arm_jpos()
-            self.scales[-1].set(gripper_state)
-            [scl.set(jp) for scl, jp in zip(self.scales[:-1], arm_jpos)]
+            # read positions and update scales, servos are passive so this
+            # falls back to reading them once the prediction is too uncertain
+            state = self.robot.get_arm_state(estimate=True)
+            self.scales[-1].set(state.gripper_state)
+            [scl.set(jp) for scl, jp in zip(self.scales[:-1], state.arm_jpos)]
 
         self.after(self.cycle_time, self.update)
 
@@ -155,6 +155,9 @@ def main():
 
     controller_type = 'sim' if args.sim else 'real'
     robot = RobotArm(controller_type)
+    if controller_type == 'real':
+        # scales are refreshed every cycle, so serve reads from telemetry
+        robot.controller.start_telemetry()
 
     root = tk.Tk()
     root.title('Simple Control of Robot Joints')
@@ -19,8 +19,8 @@ class MovementDispatcher(Thread):
         self.running=True
 
     def run(self):
-        '''Issue all commands sequentially.  Currently, the arm movement is
-        performed first, followed by gripper movement
+        '''Issue all commands sequentially.  The arm and gripper of each row
+        are moved together
         '''
         children = self.table.get_children()
         for i in self.idxs:
@@ -30,8 +30,7 @@ class MovementDispatcher(Thread):
             arm_jpos = full_arm_state[:-1]
             gripper_state = full_arm_state[-1]
 
-            self.robot.move_arm_jpos(arm_jpos)
-            self.robot.set_gripper_state(gripper_state)
+            self.robot.move_full_state(arm_jpos, gripper_state)
             if not self.running:
                 break
 
@@ -116,8 +115,7 @@ class GUI(tk.Frame):
 
     def append(self):
         if not self.moving:
-            new = self.robot.get_arm_jpos()
-            new.append(self.robot.get_gripper_state())
+            new = self.robot.get_arm_state().as_array().tolist()
             self.data.append(new)
             id_ = self.table.insert('','end', values=[f'{a:.2f}' for a in new])
 
@@ -132,8 +130,7 @@ class GUI(tk.Frame):
             selected = selected[0]
             selected_id = self.table.index(selected)
 
-            new = self.robot.get_arm_jpos()
-            new.append(self.robot.get_gripper_state())
+            new = self.robot.get_arm_state().as_array().tolist()
             self.data.append(new)
 
             id_ = self.table.insert('',selected_id, values=[f'{a:.2f}' for a in new])
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+import argparse
+import time
+
+from nuro_arm.robot.xarm_controller import XArmController
+from nuro_arm.robot.xarm_emulator import EmulatedDevice
+
+def bench_reads(xarm, duration):
+    '''Read positions of all servos back to back
+
+    Returns
+    -------
+    float
+        reads per second
+    '''
+    n_reads = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        xarm.read_jpos(xarm.servo_ids)
+        n_reads += 1
+    return n_reads / (time.perf_counter() - start)
+
+def bench_moves(xarm, duration):
+    '''Command all servos to hold their current position back to back, so
+    the arm does not move during the benchmark
+
+    Returns
+    -------
+    float
+        move commands per second
+    '''
+    jpos = xarm.read_jpos(xarm.servo_ids)
+    n_moves = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        xarm.move_servos(xarm.servo_ids, jpos, duration=0)
+        n_moves += 1
+    return n_moves / (time.perf_counter() - start)
+
+def print_latency_stats(stats):
+    print(f"{'':>14}{'count':>8}{'mean':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+    for name, s in sorted(stats.items()):
+        row = [1000*s[k] for k in ('mean', 'p50', 'p90', 'p99', 'max')]
+        print(f"{name:>14}{s['count']:>8}" + ''.join(f'{v:>9.3f}' for v in row))
+    print('(latencies in ms, percentiles are upper bounds of histogram buckets)')
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark communication with the xArm')
+    parser.add_argument('--serial', type=str, default=None,
+                        help="serial number of xArm to connect to")
+    parser.add_argument('--emulated', action='store_true',
+                        help="benchmark an emulated xArm instead of real hardware")
+    parser.add_argument('--duration', '-d', type=float, default=3,
+                        help="duration in seconds of each benchmark")
+    parser.add_argument('--latency', type=float, default=0.0005,
+                        help="latency in seconds of emulated device")
+    parser.add_argument('--jitter', type=float, default=0.0002,
+                        help="jitter in seconds of emulated device")
+    args = parser.parse_args()
+
+    device = None
+    if args.emulated:
+        device = EmulatedDevice(latency=args.latency, jitter=args.jitter)
+
+    xarm = XArmController(args.serial, device)
+    xarm.latency.enabled = True
+
+    print(f'Benchmarking xArm {xarm.serial_number} for {args.duration:.1f}s per test\n')
+    read_rate = bench_reads(xarm, args.duration)
+    move_rate = bench_moves(xarm, args.duration)
+
+    print(f'POSITION_READ rate : {read_rate:.1f} Hz')
+    print(f'MOVE throughput    : {move_rate:.1f} Hz\n')
+    print_latency_stats(xarm.get_latency_stats())
+    print('\nI/O stats:', xarm.get_io_stats())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+import argparse
+
+from nuro_arm.robot.arm_daemon import ArmDaemon
+from nuro_arm.robot.xarm_emulator import EmulatedDevice
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the xArm to other processes,'
+                                     ' which connect with RobotArm("remote")')
+    parser.add_argument('--serial', type=str, default=None,
+                        help="serial number of xArm to connect to")
+    parser.add_argument('--emulated', action='store_true',
+                        help="serve an emulated xArm instead of real hardware")
+    parser.add_argument('--address', type=str, default=None,
+                        help="path of unix socket on which clients are served,"
+                        " defaults to xarm.sock in a private per-user directory")
+    parser.add_argument('--rate', type=float, default=50,
+                        help="frequency (Hz) at which joint positions are polled")
+    args = parser.parse_args()
+
+    device = EmulatedDevice() if args.emulated else None
+    daemon = ArmDaemon(args.serial, device, args.address, args.rate)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.close()
+
+if __name__ == "__main__":
+    main()
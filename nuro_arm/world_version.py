@@ -0,0 +1,33 @@
+import threading
+from collections import defaultdict
+
+# version of the bodies in each pybullet client, incremented whenever bodies
+# are added, removed or moved through nuro_arm
+_versions = defaultdict(int)
+_lock = threading.Lock()
+
+def bump_world_version(pb_client):
+    '''Mark that bodies in a pybullet client have changed, so cached collision
+    results for that client are no longer valid
+
+    Parameters
+    ----------
+    pb_client : int
+        physics client id
+    '''
+    with _lock:
+        _versions[pb_client] += 1
+
+def get_world_version(pb_client):
+    '''Get version of the bodies in a pybullet client
+
+    Parameters
+    ----------
+    pb_client : int
+        physics client id
+
+    Returns
+    -------
+    int
+    '''
+    return _versions.get(pb_client, 0)
@@ -33,6 +33,8 @@ setup(
     entry_points={
         'console_scripts': [
             'calibrate_xarm=nuro_arm.scripts.calibrate_xarm:main',
+            'xarm_bench=nuro_arm.scripts.xarm_bench:main',
+            'xarm_daemon=nuro_arm.scripts.xarm_daemon:main',
             'calibrate_camera=nuro_arm.scripts.calibrate_camera:main',
             'move_arm_with_gui=nuro_arm.scripts.move_arm_with_gui:main',
             'record_movements=nuro_arm.scripts.record_movements:main',
@@ -0,0 +1,38 @@
+from nuro_arm.robot.hid_scheduler import TransactionScheduler
+from nuro_arm.robot.xarm_codec import CmdLib, PacketCodec
+from nuro_arm.robot.xarm_emulator import EmulatedDevice
+
+codec = PacketCodec()
+
+def read_positions(scheduler, servo_ids, timeout=200):
+    msg = bytes(codec.encode(CmdLib.POSITION_READ, [len(servo_ids), *servo_ids]))
+    ret = scheduler.transact(msg, reply_cmd=CmdLib.POSITION_READ, timeout=timeout)
+    return codec.decode_servo_ids(ret, 'short').tolist()
+
+def queue_stale_reply(device, servo_ids):
+    '''Leave reply to a read of servo_ids unread, as if that read timed out
+    '''
+    device.write(codec.encode(CmdLib.POSITION_READ, [len(servo_ids), *servo_ids]))
+
+def test_stale_reply_to_other_servos_is_discarded():
+    device = EmulatedDevice(latency=0, jitter=0)
+    scheduler = TransactionScheduler(device)
+    queue_stale_reply(device, [3, 4])
+    assert read_positions(scheduler, [1, 2]) == [1, 2]
+    assert scheduler.stats['stale_replies'] == 1
+    scheduler.close()
+
+def test_stale_subset_reply_is_discarded():
+    device = EmulatedDevice(latency=0, jitter=0)
+    scheduler = TransactionScheduler(device)
+    queue_stale_reply(device, [1])
+    assert read_positions(scheduler, [1, 2, 3, 4, 5, 6]) == [1, 2, 3, 4, 5, 6]
+    assert scheduler.stats['stale_replies'] == 1
+    scheduler.close()
+
+def test_reply_without_disconnected_servo_is_returned():
+    device = EmulatedDevice(servo_ids=(1, 2, 3, 4, 5), latency=0, jitter=0)
+    scheduler = TransactionScheduler(device)
+    assert read_positions(scheduler, [1, 2, 3, 4, 5, 6], timeout=50) == [1, 2, 3, 4, 5]
+    assert scheduler.stats['timeouts'] == 0
+    scheduler.close()
@@ -0,0 +1,54 @@
+import numpy as np
+
+from nuro_arm.robot.xarm_controller import XArmController
+from nuro_arm.robot.xarm_emulator import EmulatedDevice, EmulatedServo
+
+class BlockedServo(EmulatedServo):
+    '''Servo that cannot move beyond stop (positional units), as if blocked
+    by an object
+    '''
+    stop = EmulatedServo.HOME
+
+    def _physical_position(self, t):
+        pos = super()._physical_position(t)
+        return float(np.clip(pos, min(self.HOME, self.stop), max(self.HOME, self.stop)))
+
+def block_servo(xarm, joint_id, jpos):
+    '''Block servo of joint at jpos (radians), short of where it is sent
+    '''
+    servo = xarm.device.servos[joint_id]
+    servo.__class__ = BlockedServo
+    servo.stop = float(xarm._units.to_pos_units([joint_id], [jpos])[0])
+
+def test_blocked_joint_is_stalled():
+    xarm = XArmController(device=EmulatedDevice(latency=0, jitter=0))
+    wrist = xarm.get_joint_id('wrist')
+    # blocked near the end of the move, so the joint lags the profile by
+    # less than the lag tolerance
+    block_servo(xarm, wrist, 0.95)
+    try:
+        joint_ids = xarm.arm_joint_ids
+        target = np.full(len(joint_ids), 1.0)
+        duration = xarm.write_jpos(joint_ids, target)
+        success, _ = xarm.monitor(joint_ids, target, duration)
+        assert not success
+        assert xarm.stalled_joint_ids == [wrist]
+    finally:
+        xarm.disconnect()
+
+def test_allowed_stall_does_not_abort():
+    xarm = XArmController(device=EmulatedDevice(latency=0, jitter=0))
+    gripper = xarm.gripper_joint_ids[0]
+    closed = xarm._gripper_state_to_jpos(1.0)
+    block_servo(xarm, gripper, np.ravel(xarm._gripper_state_to_jpos(0.5))[0])
+    try:
+        joint_ids = xarm.arm_joint_ids + xarm.gripper_joint_ids
+        target = np.append(np.full(len(xarm.arm_joint_ids), 1.0), closed)
+        duration = xarm.write_jpos(joint_ids, target)
+        abort_on_stall = np.arange(len(joint_ids)) < len(xarm.arm_joint_ids)
+        _, jpos = xarm.monitor(joint_ids, target, duration,
+                               abort_on_stall=abort_on_stall)
+        assert np.allclose(jpos[:-1], target[:-1], atol=xarm.movement_precision)
+        assert xarm.stalled_joint_ids == [gripper]
+    finally:
+        xarm.disconnect()